@@ -0,0 +1,187 @@
+from constants import (
+    CONNECT_TIMEOUT,
+    DATAGRAM_PAYLOAD_SIZE,
+)
+
+import asyncio
+import socket
+from threading import Thread, get_ident
+from typing import Dict
+from Framing import FRAME_HEADER, pack_frame, check_frame_length
+from Fragmenter import Reassembler, fragment
+from NetworkManager import NetworkManager
+from Transport import Transport, get_myip
+from RetryPolicy import CircuitBreaker
+
+
+class UdpProtocol(asyncio.DatagramProtocol):
+    def __init__(self, node_transport: "AsyncioTransport"):
+        self.node_transport = node_transport
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        try:
+            self.node_transport._handle_datagram(data, addr[0])
+        except Exception as e:
+            print(end="")
+
+    def error_received(self, exc: Exception) -> None:
+        print(end="")
+
+
+class AsyncioTransport(Transport):
+    def __init__(self, port: int, address: str = None):
+        super().__init__(address or get_myip())
+        self.port = port
+        self.loop = asyncio.new_event_loop()
+        self.udp_transport = None
+        self.reassembler = Reassembler()
+        self.peer_writers: Dict[str, asyncio.StreamWriter] = {}
+        self.peer_locks: Dict[str, asyncio.Lock] = {}
+        self.peer_breakers: Dict[str, CircuitBreaker] = {}
+        self.send_failures = 0
+        self.loop_thread = Thread(target=self._run_loop, daemon=True)
+        self.loop_thread.start()
+
+    def _run_loop(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def _in_loop(self) -> bool:
+        return self.loop_thread.ident == get_ident()
+
+    def _submit(self, coro) -> None:
+        if self._in_loop():
+            self.loop.create_task(coro)
+        else:
+            asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def call_soon(self, callback, *args) -> None:
+        if self._in_loop():
+            self.loop.call_soon(callback, *args)
+        else:
+            self.loop.call_soon_threadsafe(callback, *args)
+
+    def can_block(self) -> bool:
+        # a full queue must never stall the event loop, so the loop drops instead of waiting
+        return not self._in_loop()
+
+    def start(self, receive) -> None:
+        super().start(receive)
+        self._submit(self._listen_tcp_async())
+        self._submit(self._listen_udp_async())
+
+    def close_peer(self, address: str) -> None:
+        self.call_soon(self._close_writer, address)
+
+    def _close_writer(self, ip: str) -> None:
+        writer = self.peer_writers.pop(ip, None)
+        if writer is not None:
+            writer.close()
+
+    def send(self, address: str, payload: bytes) -> None:
+        self._submit(self._send_async(payload, address))
+
+    def broadcast(self, payload: bytes) -> None:
+        self.call_soon(self._broadcast_payload, payload)
+
+    async def _listen_tcp_async(self) -> None:
+        await asyncio.start_server(self._serve_stream, port=self.port, reuse_address=True)
+
+    async def _listen_udp_async(self) -> None:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        sock.bind(("", self.port))
+        self.udp_transport, _ = await self.loop.create_datagram_endpoint(lambda: UdpProtocol(self), sock=sock)
+
+    def _handle_datagram(self, data: bytes, ip: str) -> None:
+        if self.address == ip:
+            return
+
+        data = self.reassembler.add(ip, data)
+        if data is not None:
+            self.receive(data, ip)
+
+    async def _serve_stream(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        ip = writer.get_extra_info("peername")[0]
+        try:
+            while True:
+                header = await reader.readexactly(FRAME_HEADER.size)
+                (length,) = FRAME_HEADER.unpack(header)
+                check_frame_length(length)
+                data = await reader.readexactly(length)
+                try:
+                    self.receive(data, ip)
+                except Exception as e:
+                    print(end="")
+        except (asyncio.IncompleteReadError, OSError):
+            pass
+        finally:
+            writer.close()
+
+    def _broadcast_payload(self, payload: bytes) -> None:
+        if self.udp_transport is None:
+            return
+        try:
+            for datagram in fragment(payload, DATAGRAM_PAYLOAD_SIZE):
+                self.udp_transport.sendto(datagram, ("<broadcast>", self.port))
+        except Exception as e:
+            print(end="")
+
+    def get_health(self) -> Dict[str, dict]:
+        return {
+            ip: {"connected": ip in self.peer_writers, "circuit": breaker.state, "consecutive_failures": breaker.consecutive_failures}
+            for ip, breaker in list(self.peer_breakers.items())
+        }
+
+    def get_send_failures(self) -> int:
+        return self.send_failures
+
+    async def _send_async(self, payload: bytes, ip: str) -> None:
+        if ip not in self.peer_locks:
+            self.peer_locks[ip] = asyncio.Lock()
+            self.peer_breakers[ip] = CircuitBreaker()
+        breaker = self.peer_breakers[ip]
+        if breaker.is_open():
+            self.dead_letters.add(ip, len(payload), "circuit open")
+            return
+
+        frame = pack_frame(payload)
+        async with self.peer_locks[ip]:
+            if not breaker.allow():
+                self.dead_letters.add(ip, len(payload), "circuit open")
+                return
+            for attempt in range(self.retry_policy.max_attempts):
+                try:
+                    writer = self.peer_writers.get(ip)
+                    if writer is None or writer.is_closing():
+                        _, writer = await asyncio.wait_for(asyncio.open_connection(ip, self.port), CONNECT_TIMEOUT)
+                        self.peer_writers[ip] = writer
+                    writer.write(frame)
+                    await writer.drain()
+                    breaker.record_success()
+                    return
+                except (OSError, asyncio.TimeoutError):
+                    writer = self.peer_writers.pop(ip, None)
+                    if writer is not None:
+                        writer.close()
+                    self.send_failures += 1
+                    breaker.record_failure()
+                    if not breaker.allow():
+                        self.dead_letters.add(ip, len(payload), "circuit open")
+                        return
+                    if attempt + 1 < self.retry_policy.max_attempts:
+                        await asyncio.sleep(self.retry_policy.backoff(attempt))
+            self.dead_letters.add(ip, len(payload), "retries exhausted")
+
+
+class AsyncNetworkManager(NetworkManager):
+    def __init__(self, port, **kwargs):
+        super().__init__(port, transport=AsyncioTransport(port, kwargs.get("ip")), **kwargs)
+
+    def handle_user_input_threaded(self, operation_value: str, variable_name: str):
+        if self.wal is not None:
+            # sending fsyncs the log first, which must not stall the event loop
+            super().handle_user_input_threaded(operation_value, variable_name)
+            return
+        self.transport.call_soon(self.handle_user_input, operation_value, variable_name)
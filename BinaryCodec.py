@@ -0,0 +1,322 @@
+from constants import (
+    MSG_HELLO,
+    MSG_HELLO_RECEIVED,
+    MSG_VARIABLE_UPDATE,
+    MSG_VARIABLE_UPDATE_BATCH,
+    MSG_START_SYNC,
+    MSG_STOP_SYNC,
+    MSG_STATUS_REQUEST,
+    MSG_STATUS,
+    MSG_NONCE_REQUEST,
+    MSG_NONCE_SEND,
+    MSG_SYNC_DATA,
+    MSG_SYNC_MISMATCH_DATA,
+    MSG_SYNC_MISMATCH_REQUEST,
+    MSG_VERSION_VECTOR,
+    MSG_CHECKPOINT_PROPOSE,
+    MSG_CHECKPOINT_VOTE,
+    MSG_CHECKPOINT_COMMIT,
+    MSG_GOSSIP,
+    BINARY_MAGIC,
+    BINARY_VERSION,
+)
+
+import struct
+from typing import Optional, Tuple
+
+# magic, version, type code and sync round (-1 if unset): enough to route or drop a message without reading its body
+HEADER = struct.Struct("!BBBi")
+FLOAT = struct.Struct("!d")
+
+# append only: the index of a message type / field name is its code on the wire
+MSG_TYPES = [
+    MSG_HELLO,
+    MSG_HELLO_RECEIVED,
+    MSG_VARIABLE_UPDATE,
+    MSG_VARIABLE_UPDATE_BATCH,
+    MSG_START_SYNC,
+    MSG_STOP_SYNC,
+    MSG_STATUS_REQUEST,
+    MSG_STATUS,
+    MSG_NONCE_REQUEST,
+    MSG_NONCE_SEND,
+    MSG_SYNC_DATA,
+    MSG_SYNC_MISMATCH_DATA,
+    MSG_SYNC_MISMATCH_REQUEST,
+    MSG_VERSION_VECTOR,
+    MSG_CHECKPOINT_PROPOSE,
+    MSG_CHECKPOINT_VOTE,
+    MSG_CHECKPOINT_COMMIT,
+    MSG_GOSSIP,
+]
+FIELD_NAMES = [
+    "status",
+    "ip",
+    "variable_name",
+    "operation",
+    "nonce",
+    "nonce_ranges",
+    "variable_max_nonce_dict",
+    "variable_value_dict",
+    "nonce_number_list",
+    "nonce_dict",
+    "history",
+    "previous_value",
+    "wire_formats",
+    "chunk_index",
+    "chunk_count",
+    "nonce_range_list",
+    "version_vectors",
+    "checkpoint_id",
+    "checkpoint_cuts",
+    "sync_round",
+    "incarnation",
+    "members",
+    "digests",
+    "operations",
+    "is_reply",
+]
+MSG_TYPE_CODES = {msg_type: code for code, msg_type in enumerate(MSG_TYPES)}
+FIELD_CODES = {field: code for code, field in enumerate(FIELD_NAMES)}
+VARIABLE_UPDATE_CODE = MSG_TYPE_CODES[MSG_VARIABLE_UPDATE]
+UNKNOWN_MSG_TYPE = 0xFF
+UNKNOWN_FIELD = 0xFF
+
+TAG_NONE = 0
+TAG_FALSE = 1
+TAG_TRUE = 2
+TAG_INT = 3
+TAG_STR = 4
+TAG_LIST = 5
+TAG_DICT = 6
+TAG_FLOAT = 7
+TAG_INT_MAP = 8
+
+
+def zigzag(value: int) -> int:
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+
+def unzigzag(value: int) -> int:
+    return value >> 1 if not value & 1 else -((value + 1) >> 1)
+
+
+def write_varint(out: bytearray, value: int) -> None:
+    if value < 0x80:
+        out.append(value)
+        return
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def read_varint(data, offset: int) -> Tuple[int, int]:
+    byte = data[offset]
+    if byte < 0x80:
+        return byte, offset + 1
+    result = byte & 0x7F
+    shift = 7
+    offset += 1
+    while True:
+        byte = data[offset]
+        offset += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, offset
+        shift += 7
+
+
+def write_str(out: bytearray, value: str) -> None:
+    encoded = value.encode()
+    write_varint(out, len(encoded))
+    out += encoded
+
+
+def read_str(data, offset: int) -> Tuple[str, int]:
+    length, offset = read_varint(data, offset)
+    return bytes(data[offset : offset + length]).decode(), offset + length
+
+
+def is_int_map(value: dict) -> bool:
+    for key, item in value.items():
+        if type(key) is not int or type(item) is not int:
+            return False
+    return True
+
+
+def write_value(out: bytearray, value) -> None:
+    if value is None:
+        out.append(TAG_NONE)
+    elif value is True:
+        out.append(TAG_TRUE)
+    elif value is False:
+        out.append(TAG_FALSE)
+    elif isinstance(value, int):
+        out.append(TAG_INT)
+        write_varint(out, zigzag(value))
+    elif isinstance(value, str):
+        out.append(TAG_STR)
+        write_str(out, value)
+    elif isinstance(value, float):
+        out.append(TAG_FLOAT)
+        out += FLOAT.pack(value)
+    elif isinstance(value, (list, tuple)):
+        out.append(TAG_LIST)
+        write_varint(out, len(value))
+        for item in value:
+            write_value(out, item)
+    elif isinstance(value, dict) and value and is_int_map(value):
+        # nonce -> operation maps: sorted, delta encoded keys and zigzag values
+        out.append(TAG_INT_MAP)
+        write_varint(out, len(value))
+        previous_key = 0
+        for key in sorted(value):
+            delta = key - previous_key
+            item = value[key]
+            write_varint(out, delta * 2 if delta >= 0 else -delta * 2 - 1)
+            write_varint(out, item * 2 if item >= 0 else -item * 2 - 1)
+            previous_key = key
+    elif isinstance(value, dict):
+        out.append(TAG_DICT)
+        write_varint(out, len(value))
+        for key, item in value.items():
+            write_value(out, key)
+            write_value(out, item)
+    else:
+        raise TypeError(f"cannot encode {type(value).__name__}")
+
+
+def read_value(data, offset: int):
+    tag = data[offset]
+    offset += 1
+    if tag == TAG_NONE:
+        return None, offset
+    if tag == TAG_TRUE:
+        return True, offset
+    if tag == TAG_FALSE:
+        return False, offset
+    if tag == TAG_INT:
+        value, offset = read_varint(data, offset)
+        return unzigzag(value), offset
+    if tag == TAG_STR:
+        return read_str(data, offset)
+    if tag == TAG_FLOAT:
+        return FLOAT.unpack_from(data, offset)[0], offset + FLOAT.size
+    if tag == TAG_LIST:
+        count, offset = read_varint(data, offset)
+        items = []
+        for _ in range(count):
+            item, offset = read_value(data, offset)
+            items.append(item)
+        return items, offset
+    if tag == TAG_INT_MAP:
+        count, offset = read_varint(data, offset)
+        int_map = {}
+        key = 0
+        for _ in range(count):
+            delta, offset = read_varint(data, offset)
+            value, offset = read_varint(data, offset)
+            key += delta >> 1 if not delta & 1 else -((delta + 1) >> 1)
+            int_map[key] = value >> 1 if not value & 1 else -((value + 1) >> 1)
+        return int_map, offset
+    if tag == TAG_DICT:
+        count, offset = read_varint(data, offset)
+        items = {}
+        for _ in range(count):
+            key, offset = read_value(data, offset)
+            item, offset = read_value(data, offset)
+            items[key] = item
+        return items, offset
+    raise ValueError(f"unknown tag {tag}")
+
+
+def is_binary(data) -> bool:
+    return len(data) >= HEADER.size and data[0] == BINARY_MAGIC
+
+
+def encode(msg_dict: dict) -> bytes:
+    msg_type = msg_dict["msg_type"]
+    sync_round = msg_dict.get("sync_round")
+    if msg_type == MSG_VARIABLE_UPDATE:
+        return encode_variable_update(msg_dict["variable_name"], msg_dict["operation"], msg_dict["nonce"], sync_round)
+
+    out = bytearray(
+        HEADER.pack(
+            BINARY_MAGIC,
+            BINARY_VERSION,
+            MSG_TYPE_CODES.get(msg_type, UNKNOWN_MSG_TYPE),
+            -1 if sync_round is None else sync_round,
+        )
+    )
+    if msg_type not in MSG_TYPE_CODES:
+        write_str(out, msg_type)
+
+    write_varint(out, len(msg_dict) - 1 - ("sync_round" in msg_dict))
+    for field, value in msg_dict.items():
+        if field == "msg_type" or field == "sync_round":
+            continue
+        field_code = FIELD_CODES.get(field, UNKNOWN_FIELD)
+        out.append(field_code)
+        if field_code == UNKNOWN_FIELD:
+            write_str(out, field)
+        write_value(out, value)
+    return bytes(out)
+
+
+def encode_variable_update(variable_name: str, operation: int, nonce: int, sync_round: Optional[int] = None) -> bytes:
+    # the hottest message skips field codes: header, zigzag operation, varint nonce and the name
+    out = bytearray(HEADER.pack(BINARY_MAGIC, BINARY_VERSION, VARIABLE_UPDATE_CODE, -1 if sync_round is None else sync_round))
+    write_varint(out, zigzag(operation))
+    write_varint(out, nonce)
+    write_str(out, variable_name)
+    return bytes(out)
+
+
+def peek_header(data) -> Tuple[str, Optional[int], int]:
+    # message type, sync round and where the body starts; nothing past the header is decoded
+    magic, version, type_code, sync_round = HEADER.unpack_from(data, 0)
+    if magic != BINARY_MAGIC or version != BINARY_VERSION:
+        raise ValueError(f"unsupported binary message version {version}")
+
+    offset = HEADER.size
+    if type_code == UNKNOWN_MSG_TYPE:
+        msg_type, offset = read_str(data, offset)
+    else:
+        msg_type = MSG_TYPES[type_code]
+    return msg_type, None if sync_round < 0 else sync_round, offset
+
+
+def decode_variable_update(data) -> Tuple[str, int, int, Optional[int]]:
+    magic, version, _, sync_round = HEADER.unpack_from(data, 0)
+    if magic != BINARY_MAGIC or version != BINARY_VERSION:
+        raise ValueError(f"unsupported binary message version {version}")
+    operation, offset = read_varint(data, HEADER.size)
+    nonce, offset = read_varint(data, offset)
+    name, _ = read_str(data, offset)
+    return name, unzigzag(operation), nonce, None if sync_round < 0 else sync_round
+
+
+def decode_body(data, offset: int, target) -> None:
+    # target is anything that takes fields by item assignment: a dict or a message object
+    field_count, offset = read_varint(data, offset)
+    for _ in range(field_count):
+        field_code = data[offset]
+        offset += 1
+        if field_code == UNKNOWN_FIELD:
+            field, offset = read_str(data, offset)
+        else:
+            field = FIELD_NAMES[field_code]
+        target[field], offset = read_value(data, offset)
+
+
+def decode(data) -> dict:
+    msg_type, sync_round, offset = peek_header(data)
+    msg_dict = {"msg_type": msg_type}
+    if msg_type == MSG_VARIABLE_UPDATE:
+        msg_dict["variable_name"], msg_dict["operation"], msg_dict["nonce"], _ = decode_variable_update(data)
+    else:
+        decode_body(data, offset, msg_dict)
+    if sync_round is not None:
+        msg_dict["sync_round"] = sync_round
+    return msg_dict
@@ -2,6 +2,7 @@ from constants import (
     MSG_HELLO,
     MSG_HELLO_RECEIVED,
     MSG_VARIABLE_UPDATE,
+    MSG_VARIABLE_UPDATE_BATCH,
     MSG_START_SYNC,
     MSG_STOP_SYNC,
     MSG_STATUS_REQUEST,
@@ -9,27 +10,68 @@ from constants import (
     MSG_NONCE_REQUEST,
     MSG_NONCE_SEND,
     MSG_SYNC_DATA,
+    WAL_RECORD_OPERATE,
+    WAL_RECORD_UPDATE,
+    WAL_RECORD_SYNC_DATA,
+    WAL_RECORD_MERGE,
+    WAL_RECORD_SYNC,
+    WAL_RECORD_RESET,
+    WAL_RECORD_CHECKPOINT,
+    WAL_RECORD_RETIRE,
 )
 from Msg import Msg
+from OpLog import OpLog
+from GapIndex import GapIndex, NonceRange
+from threading import RLock
+from typing import Callable, Optional, Union
 
-HistoryObject = dict[int, int]
+HistoryObject = Union[dict[int, int], OpLog]
 History = dict[str, HistoryObject]
+# appends (record type, variable name, arguments) to a durable log and returns the record's sequence number
+Journal = Callable[[int, str, tuple], int]
 
 
 class CRDT:
-    def __init__(self, name):
+    def __init__(
+        self,
+        name,
+        history_factory: Callable[[], HistoryObject] = dict,
+        debug_verify: bool = False,
+        node_id: str = None,
+    ):
+        self.node_id = node_id
+        self.lock = RLock()
+        self.history_factory = history_factory
+        self.debug_verify = debug_verify
         self.sync_history: History = {}
-        self.self_history: HistoryObject = {}
+        self.self_history: HistoryObject = history_factory()
+        self.self_sum = 0
+        self.sync_sums: dict[str, int] = {}
+        self.gap_indexes: dict[str, GapIndex] = {}
+        self.checkpoint_cuts: dict[str, int] = {}
         self.value = 0
         self.current_nonce = 0
         self.before_sync_value = 0
         self.name = name
+        self.journal: Optional[Journal] = None
+        self.last_lsn = 0
+
+    def _log(self, record_type: int, *args) -> None:
+        # called under the lock together with the change it describes, so last_lsn always matches the state
+        if self.journal is not None:
+            self.last_lsn = self.journal(record_type, self.name, args)
 
     def reset(self) -> None:
-        self.before_sync_value = self.value
-        self.current_nonce = 0
-        self.sync_history = {}
-        self.self_history = {}
+        with self.lock:
+            self._log(WAL_RECORD_RESET)
+            self.before_sync_value = self.value
+            self.current_nonce = 0
+            self.sync_history = {}
+            self.self_history = self.history_factory()
+            self.self_sum = 0
+            self.sync_sums = {}
+            self.gap_indexes = {}
+            self.checkpoint_cuts = {}
 
     def set_value(self, value: int) -> None:
         self.value = value
@@ -49,41 +91,188 @@ class CRDT:
     def get_nonce_value(self, nonce: int) -> int:
         return self.self_history[nonce]
 
-    def operate(self, value: int) -> None:
-        self.value += value
-        self._add_to_self_history(value)
+    def operate(self, value: int) -> int:
+        # the nonce is allocated under the variable lock, so concurrent local writers never share one
+        with self.lock:
+            nonce = self._add_to_self_history(value)
+            self.value += value
+            self._log(WAL_RECORD_OPERATE, nonce, value)
+            return nonce
+
+    def _add_to_self_history(self, value: int) -> int:
+        nonce = self.current_nonce
+        self.self_history[nonce] = value
+        self.self_sum += value
+        self.current_nonce = nonce + 1
+        return nonce
+
+    def _ensure_node(self, node_id: str) -> None:
+        if node_id not in self.sync_history:
+            self.sync_history[node_id] = self.history_factory()
+            self.sync_sums[node_id] = 0
+            self.gap_indexes[node_id] = GapIndex()
 
-    def _add_to_self_history(self, value: int) -> None:
-        self.self_history[self.current_nonce] = value
-        self.current_nonce += 1
+    def _add_to_sync_history(self, node_id: str, nonce: int, operation_value: int) -> int:
+        if nonce < self.checkpoint_cuts.get(node_id, 0):
+            return 0
+        node_history = self.sync_history[node_id]
+        delta = operation_value - node_history.get(nonce, 0)
+        node_history[nonce] = operation_value
+        self.sync_sums[node_id] += delta
+        self.gap_indexes[node_id].add(nonce)
+        return delta
 
-    def _add_to_sync_history(self, node_id: str, nonce: int, operation_value: int) -> None:
-        self.sync_history[node_id][nonce] = operation_value
+    def merge_sync_history(self, node_id: str, history: HistoryObject) -> None:
+        with self.lock:
+            self._log(WAL_RECORD_MERGE, node_id, history)
+            self._merge_sync_history(node_id, history)
+
+    def _merge_sync_history(self, node_id: str, history: HistoryObject) -> None:
+        self._ensure_node(node_id)
+        node_history = self.sync_history[node_id]
+        gap_index = self.gap_indexes[node_id]
+        cut = self.checkpoint_cuts.get(node_id, 0)
+        delta = 0
+        merged = []
+        for nonce, operation_value in history.items():
+            if nonce < cut:
+                continue
+            delta += operation_value - node_history.get(nonce, 0)
+            merged.append((nonce, operation_value))
+        # nothing is stored before every delta is known, so a malformed value leaves the history and its sums as they were
+        for nonce, operation_value in merged:
+            node_history[nonce] = operation_value
+            gap_index.add(nonce)
+        self.sync_sums[node_id] += delta
 
     def handle_msg(self, msg: Msg, ip: str) -> None:
-        if ip not in self.sync_history:
-            self.sync_history[ip] = {}
+        with self.lock:
+            self._handle_msg(msg, ip)
+
+    def _handle_msg(self, msg: Msg, ip: str) -> None:
+        self._ensure_node(ip)
 
         if msg.__getitem__("msg_type") == MSG_VARIABLE_UPDATE:
             operation_value = msg.__getitem__("operation")
             nonce = msg.__getitem__("nonce")
+            self._log(WAL_RECORD_UPDATE, ip, [[nonce, [operation_value]]])
             self._handle_variable_update(operation_value, nonce, ip)
 
+        if msg.__getitem__("msg_type") == MSG_VARIABLE_UPDATE_BATCH:
+            nonce_ranges = msg.__getitem__("nonce_ranges")
+            self._log(WAL_RECORD_UPDATE, ip, nonce_ranges)
+            self._handle_variable_update_batch(nonce_ranges, ip)
+
         if msg.__getitem__("msg_type") == MSG_SYNC_DATA:
             history = msg.convert_dict_to_dict(msg.__getitem__("history"))
             previous_value = msg.__getitem__("previous_value")
-            self._handle_sync_data(ip, previous_value, history)
+            is_last_chunk = msg.get("chunk_index", 0) == msg.get("chunk_count", 1) - 1
+            checkpoint_cuts = msg.get("checkpoint_cuts", {})
+            self._log(WAL_RECORD_SYNC_DATA, ip, previous_value, history, is_last_chunk, checkpoint_cuts)
+            self._handle_sync_data(ip, previous_value, history, is_last_chunk, checkpoint_cuts)
 
     def _handle_variable_update(self, operation_value: int, nonce: int, node_id: str):
-        self._add_to_sync_history(node_id, nonce, operation_value)
-        self.value += operation_value
+        self.value += self._add_to_sync_history(node_id, nonce, operation_value)
+
+    def _handle_variable_update_batch(self, nonce_ranges: list, node_id: str):
+        node_history = self.sync_history[node_id]
+        cut = self.checkpoint_cuts.get(node_id, 0)
+        delta = 0
+        for start_nonce, operation_values in nonce_ranges:
+            for offset, operation_value in enumerate(operation_values):
+                if start_nonce + offset >= cut:
+                    delta += operation_value - node_history.get(start_nonce + offset, 0)
+        # as in _merge_sync_history, the batch is stored only once all of it could be summed
+        for start_nonce, operation_values in nonce_ranges:
+            for offset, operation_value in enumerate(operation_values):
+                if start_nonce + offset >= cut:
+                    node_history[start_nonce + offset] = operation_value
+            self.gap_indexes[node_id].add_range(start_nonce, start_nonce + len(operation_values))
+        self.sync_sums[node_id] += delta
+        self.value += delta
 
-    def _handle_sync_data(self, node_id: str, previous_value: int, history: HistoryObject):
+    def _handle_sync_data(
+        self,
+        node_id: str,
+        previous_value: int,
+        history: HistoryObject,
+        is_last_chunk: bool = True,
+        checkpoint_cuts: dict[str, int] = None,
+    ):
+        # histories only grow between full-syncs, so chunks are merged and the value is checked once all arrived
+        checkpoint_cuts = checkpoint_cuts or {}
+        if checkpoint_cuts == self.checkpoint_cuts:
+            self.before_sync_value = previous_value
+        elif self._cuts_dominate(checkpoint_cuts, self.checkpoint_cuts):
+            self._adopt_checkpoint(previous_value, checkpoint_cuts)
+        self._merge_sync_history(node_id, history)
+        if is_last_chunk:
+            self._sync_with_history()
+
+    @staticmethod
+    def _cuts_dominate(cuts: dict[str, int], other_cuts: dict[str, int]) -> bool:
+        return all(cuts.get(node_id, 0) >= other_cuts.get(node_id, 0) for node_id in set(cuts) | set(other_cuts))
+
+    def _history_of(self, node_id: str) -> HistoryObject:
+        if node_id == self.node_id:
+            return self.self_history
+        self._ensure_node(node_id)
+        return self.sync_history[node_id]
+
+    def _discard_range(self, history: HistoryObject, start: int, end: int) -> int:
+        discarded = 0
+        for nonce in range(start, end):
+            operation_value = history.get(nonce)
+            if operation_value is not None:
+                discarded += operation_value
+                del history[nonce]
+        if isinstance(history, OpLog):
+            history.compact()
+        return discarded
+
+    def _drop_below_cut(self, node_id: str, cut: int) -> int:
+        history = self._history_of(node_id)
+        dropped = self._discard_range(history, self.checkpoint_cuts.get(node_id, 0), cut)
+        if node_id == self.node_id:
+            self.self_sum -= dropped
+            self.current_nonce = max(self.current_nonce, cut)
+        else:
+            self.sync_sums[node_id] -= dropped
+            self.gap_indexes[node_id].add_range(0, cut)
+        self.checkpoint_cuts[node_id] = cut
+        return dropped
+
+    def apply_checkpoint(self, checkpoint_cuts: dict[str, int]) -> None:
+        # operations below an agreed cut are folded into before_sync_value, so the value itself never changes
+        with self.lock:
+            self._log(WAL_RECORD_CHECKPOINT, checkpoint_cuts)
+            for node_id, cut in checkpoint_cuts.items():
+                if cut > self.checkpoint_cuts.get(node_id, 0):
+                    self.before_sync_value += self._drop_below_cut(node_id, cut)
+
+    def _adopt_checkpoint(self, previous_value: int, checkpoint_cuts: dict[str, int]) -> None:
+        # the sender's before_sync_value already contains everything below its cuts
+        for node_id, cut in checkpoint_cuts.items():
+            if cut > self.checkpoint_cuts.get(node_id, 0):
+                self._drop_below_cut(node_id, cut)
         self.before_sync_value = previous_value
-        self.sync_history[node_id] = history
-        self._sync_with_history()
 
-    def _sync_with_history(self):
+    def retire_node(self, node_id: str) -> None:
+        # a restarted node counts its nonces from zero again, its earlier operations stay in before_sync_value
+        with self.lock:
+            if node_id not in self.sync_history:
+                return
+            self._log(WAL_RECORD_RETIRE, node_id)
+            self.before_sync_value += self.sync_sums[node_id]
+            del self.sync_history[node_id]
+            del self.sync_sums[node_id]
+            del self.gap_indexes[node_id]
+            self.checkpoint_cuts.pop(node_id, None)
+
+    def get_expected_value(self) -> int:
+        return self.before_sync_value + self.self_sum + sum(self.sync_sums.values())
+
+    def _recompute_expected_value(self) -> int:
         expected_value = self.before_sync_value
 
         for key in self.self_history:
@@ -93,30 +282,192 @@ class CRDT:
             for key in self.sync_history[node]:
                 expected_value += self.sync_history[node][key]
 
+        return expected_value
+
+    def sync_with_history(self) -> None:
+        with self.lock:
+            self._log(WAL_RECORD_SYNC)
+            self._sync_with_history()
+
+    def _sync_with_history(self):
+        expected_value = self.get_expected_value()
+
+        if self.debug_verify:
+            recomputed_value = self._recompute_expected_value()
+            if recomputed_value != expected_value:
+                print(f"{self.name} ==> running sum: {expected_value} - recomputed: {recomputed_value}")
+                expected_value = recomputed_value
+
         if self.value != expected_value:
             print(f"{self.name} ==> current: {self.value} - expected: {expected_value}")
             self.value = expected_value
 
-    def _get_nonce_values(self, nonce_list: list[int]) -> dict[int, int]:
+    def clamp_nonce_ranges(self, nonce_ranges: list[NonceRange]) -> list[NonceRange]:
+        # only nonces between our own checkpoint cut and the next nonce to allocate can be in the history
+        with self.lock:
+            low = self.checkpoint_cuts.get(self.node_id, 0)
+            high = self.current_nonce
+        clamped_ranges: list[NonceRange] = []
+        for start, end in nonce_ranges:
+            start, end = max(start, low), min(end, high)
+            if start < end:
+                clamped_ranges.append([start, end])
+        return clamped_ranges
+
+    def get_nonce_values(self, nonce_ranges: list[NonceRange]) -> dict[int, int]:
+        # nonces we don't hold are skipped instead of failing the whole answer
         nonce_values: dict[int, int] = {}
-        for nonce_index in nonce_list:
-            nonce_values[nonce_index] = self.self_history[nonce_index]
+        with self.lock:
+            self_history = self.self_history
+            for start, end in nonce_ranges:
+                for nonce_index in range(start, end):
+                    operation_value = self_history.get(nonce_index)
+                    if operation_value is not None:
+                        nonce_values[nonce_index] = operation_value
 
         return nonce_values
 
-    def get_missing_nonces(self) -> dict[str, list[int]]:
-        missing_list: dict[str, list[int]] = {}
+    def get_self_history_since(self, start_nonce: int) -> tuple[list[tuple[int, int]], dict[str, int], int]:
+        # one consistent view of our own operations, the cuts they sit above and the base they add to
+        with self.lock:
+            self_history = self.self_history
+            start_nonce = max(start_nonce, self.checkpoint_cuts.get(self.node_id, 0))
+            history = [(nonce, self_history[nonce]) for nonce in range(start_nonce, self.current_nonce) if nonce in self_history]
+            return history, dict(self.checkpoint_cuts), self.before_sync_value
+
+    def get_state(self) -> dict:
+        with self.lock:
+            return {
+                "lsn": self.last_lsn,
+                "value": self.value,
+                "before_sync_value": self.before_sync_value,
+                "current_nonce": self.current_nonce,
+                "self_history": dict(self.self_history.items()),
+                "sync_history": {node_id: dict(history.items()) for node_id, history in self.sync_history.items()},
+                "checkpoint_cuts": dict(self.checkpoint_cuts),
+            }
+
+    def load_state(self, state: dict) -> None:
+        # running sums and gap indexes are derived, so snapshots leave them out and they are rebuilt here
+        with self.lock:
+            self.last_lsn = state["lsn"]
+            self.value = state["value"]
+            self.before_sync_value = state["before_sync_value"]
+            self.current_nonce = state["current_nonce"]
+            self.checkpoint_cuts = dict(state["checkpoint_cuts"])
+            self.self_history = self.history_factory()
+            self.self_history.update(state["self_history"])
+            self.self_sum = sum(state["self_history"].values())
+            self.sync_history = {}
+            self.sync_sums = {}
+            self.gap_indexes = {}
+            for node_id, history in state["sync_history"].items():
+                self._ensure_node(node_id)
+                self.sync_history[node_id].update(history)
+                self.sync_sums[node_id] = sum(history.values())
+                gap_index = self.gap_indexes[node_id]
+                if self.checkpoint_cuts.get(node_id, 0) > 0:
+                    gap_index.add_range(0, self.checkpoint_cuts[node_id])
+                start = end = None
+                for nonce in sorted(history):
+                    if nonce != end:
+                        if start is not None:
+                            gap_index.add_range(start, end)
+                        start = nonce
+                    end = nonce + 1
+                if start is not None:
+                    gap_index.add_range(start, end)
+
+    def replay(self, record_type: int, args: list) -> None:
+        # same code paths as the live messages; the journal is not attached yet, so nothing is logged twice
+        with self.lock:
+            if record_type == WAL_RECORD_OPERATE:
+                nonce, operation_value = args
+                self.value += operation_value
+                self.self_history[nonce] = operation_value
+                self.self_sum += operation_value
+                self.current_nonce = max(self.current_nonce, nonce + 1)
+            elif record_type == WAL_RECORD_UPDATE:
+                node_id, nonce_ranges = args
+                self._ensure_node(node_id)
+                self._handle_variable_update_batch(nonce_ranges, node_id)
+            elif record_type == WAL_RECORD_SYNC_DATA:
+                node_id, previous_value, history, is_last_chunk, checkpoint_cuts = args
+                self._ensure_node(node_id)
+                self._handle_sync_data(node_id, previous_value, history, is_last_chunk, checkpoint_cuts)
+            elif record_type == WAL_RECORD_MERGE:
+                self._merge_sync_history(args[0], args[1])
+            elif record_type == WAL_RECORD_SYNC:
+                self._sync_with_history()
+            elif record_type == WAL_RECORD_RESET:
+                self.reset()
+            elif record_type == WAL_RECORD_CHECKPOINT:
+                self.apply_checkpoint(args[0])
+            elif record_type == WAL_RECORD_RETIRE:
+                self.retire_node(args[0])
+
+    def get_history_size(self) -> int:
+        with self.lock:
+            return len(self.self_history) + sum(len(history) for history in self.sync_history.values())
+
+    def get_version_vector(self, self_id: str) -> dict[str, int]:
+        with self.lock:
+            version_vector = {node_id: gap_index.watermark for node_id, gap_index in self.gap_indexes.items()}
+            version_vector[self_id] = self.current_nonce
+        return version_vector
+
+    def get_digest(self, self_id: str) -> dict[str, list]:
+        # per node the nonce after the highest one we hold and the gaps below it, so a peer sends exactly what we lack
+        with self.lock:
+            digest = {node_id: [gap_index.get_high_water(), gap_index.get_missing_ranges()] for node_id, gap_index in self.gap_indexes.items()}
+            digest[self_id] = [self.current_nonce, []]
+        return digest
+
+    def get_node_operations(self, node_id: str, nonce_ranges: list[NonceRange], limit: int) -> list:
+        # up to limit of any node's operations we hold within the ranges, ours included, as runs in the update batch layout
+        operations = []
+        with self.lock:
+            if node_id == self.node_id:
+                history, high = self.self_history, self.current_nonce
+            elif node_id in self.gap_indexes:
+                history, high = self.sync_history[node_id], self.gap_indexes[node_id].get_high_water()
+            else:
+                return operations
+            low = self.checkpoint_cuts.get(node_id, 0)
+            for start, end in nonce_ranges:
+                for nonce in range(max(start, low), min(end, high)):
+                    operation_value = history.get(nonce)
+                    if operation_value is None:
+                        continue
+                    if operations and operations[-1][0] + len(operations[-1][1]) == nonce:
+                        operations[-1][1].append(operation_value)
+                    else:
+                        operations.append([nonce, [operation_value]])
+                    limit -= 1
+                    if limit == 0:
+                        return operations
+        return operations
+
+    def apply_update_batch(self, node_id: str, nonce_ranges: list) -> None:
+        # operations passed on by another peer count exactly like the origin's own update batch
+        with self.lock:
+            self._ensure_node(node_id)
+            self._log(WAL_RECORD_UPDATE, node_id, nonce_ranges)
+            self._handle_variable_update_batch(nonce_ranges, node_id)
 
-        for node_id in self.sync_history:
-            node_history = self.sync_history[node_id]
-            if len(node_history) > 0:
-                highest_index = int(max(node_history.keys()))
+    def get_missing_nonce_ranges(self, node_id: str, up_to: int = None) -> list[NonceRange]:
+        with self.lock:
+            if node_id not in self.gap_indexes:
+                return [[0, up_to]] if up_to else []
+            return self.gap_indexes[node_id].get_missing_ranges(up_to)
 
-                for i in range(highest_index):
-                    if i not in node_history:
-                        if node_id not in missing_list:
-                            missing_list[node_id] = []
+    def get_missing_nonces(self) -> dict[str, list[NonceRange]]:
+        missing_list: dict[str, list[NonceRange]] = {}
 
-                        missing_list[node_id].append(i)
+        with self.lock:
+            for node_id in self.gap_indexes:
+                missing_ranges = self.gap_indexes[node_id].get_missing_ranges()
+                if len(missing_ranges) > 0:
+                    missing_list[node_id] = missing_ranges
 
         return missing_list
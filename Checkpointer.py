@@ -0,0 +1,112 @@
+from constants import (
+    STATUS_WORK,
+    CHECKPOINT_VOTE_TIMEOUT,
+)
+
+from threading import Condition, Lock
+from typing import Dict, List
+import random
+import time
+from Msg import Msg
+
+VersionVectors = Dict[str, Dict[str, int]]
+CheckpointCuts = Dict[str, Dict[str, int]]
+
+
+class Checkpointer:
+    def __init__(self, network_manager):
+        self.network_manager = network_manager
+        self.condition = Condition()
+        self.lock = Lock()
+        self.checkpoint_id = 0
+        self.votes: Dict[str, VersionVectors] = {}
+        self.last_checkpoint_duration = 0.0
+
+    def periodic_checkpoint(self, interval: float) -> None:
+        while True:
+            time.sleep(interval * random.uniform(0.75, 1.25))
+            try:
+                self.run_checkpoint()
+            except Exception as e:
+                print("checkpoint exception:", e)
+
+    def run_checkpoint(self) -> bool:
+        network_manager = self.network_manager
+        if network_manager.current_status != STATUS_WORK:
+            return False
+
+        with self.lock:
+            started = time.time()
+            participants: List[str] = list(network_manager.peers)
+            with self.condition:
+                self.checkpoint_id += 1
+                checkpoint_id = self.checkpoint_id
+                self.votes = {network_manager.ip: network_manager._version_vector_msg()["version_vectors"]}
+
+            propose_msg = Msg().init_checkpoint_propose(checkpoint_id)
+            for node_id in participants:
+                network_manager.send_threaded(propose_msg, node_id)
+
+            with self.condition:
+                all_voted = self.condition.wait_for(
+                    lambda: all(node_id in self.votes for node_id in participants), CHECKPOINT_VOTE_TIMEOUT
+                )
+                votes = dict(self.votes)
+            if not all_voted:
+                print(f"checkpoint {checkpoint_id} aborted, missing votes")
+                return False
+
+            checkpoint_cuts = self.compute_cuts(list(votes.values()))
+            commit_msg = Msg().init_checkpoint_commit(checkpoint_id, checkpoint_cuts)
+            for node_id in participants:
+                network_manager.send_threaded(commit_msg, node_id)
+            self.apply_commit(checkpoint_id, checkpoint_cuts)
+            self.last_checkpoint_duration = time.time() - started
+            return True
+
+    @staticmethod
+    def compute_cuts(votes: List[VersionVectors]) -> CheckpointCuts:
+        # the stable frontier: every participant already holds all operations below it
+        checkpoint_cuts: CheckpointCuts = {}
+        variable_names = set(votes[0])
+        for version_vectors in votes[1:]:
+            variable_names &= set(version_vectors)
+
+        for variable_name in variable_names:
+            node_ids = set()
+            for version_vectors in votes:
+                node_ids |= set(version_vectors[variable_name])
+
+            variable_cuts: Dict[str, int] = {}
+            for node_id in node_ids:
+                cut = min(version_vectors[variable_name].get(node_id, 0) for version_vectors in votes)
+                if cut > 0:
+                    variable_cuts[node_id] = cut
+            if variable_cuts:
+                checkpoint_cuts[variable_name] = variable_cuts
+        return checkpoint_cuts
+
+    def handle_propose(self, checkpoint_id: int, ip: str) -> None:
+        network_manager = self.network_manager
+        with self.condition:
+            self.checkpoint_id = max(self.checkpoint_id, checkpoint_id)
+        if network_manager.current_status != STATUS_WORK:
+            return
+        version_vectors = network_manager._version_vector_msg()["version_vectors"]
+        network_manager.send_threaded(Msg().init_checkpoint_vote(checkpoint_id, version_vectors), ip)
+
+    def handle_vote(self, checkpoint_id: int, version_vectors: VersionVectors, ip: str) -> None:
+        with self.condition:
+            if checkpoint_id == self.checkpoint_id:
+                self.votes[ip] = version_vectors
+                self.condition.notify_all()
+
+    def apply_commit(self, checkpoint_id: int, checkpoint_cuts: CheckpointCuts) -> None:
+        network_manager = self.network_manager
+        with self.condition:
+            self.checkpoint_id = max(self.checkpoint_id, checkpoint_id)
+        if network_manager.current_status != STATUS_WORK:
+            return
+        for variable_name, variable_cuts in checkpoint_cuts.items():
+            if variable_name in network_manager.variable_name_to_object:
+                network_manager.variable_name_to_object[variable_name].apply_checkpoint(variable_cuts)
@@ -0,0 +1,182 @@
+from constants import (
+    CONNECT_TIMEOUT,
+    SEND_QUEUE_SIZE,
+)
+from Framing import pack_frame, FRAME_HEADER
+from RetryPolicy import RetryPolicy, CircuitBreaker, DeadLetters
+
+import socket
+import time
+from queue import Queue, Full
+from threading import Thread, Lock
+from typing import Dict, Optional, Tuple
+
+
+def split_address(address: str, default_port: int) -> Tuple[str, int]:
+    # peers are plain ips on a LAN, or "host:port" when several nodes share a host
+    host, _, port = address.partition(":")
+    return host, int(port) if port else default_port
+
+
+class PeerConnection:
+    def __init__(
+        self,
+        ip: str,
+        port: int,
+        greeting: Optional[bytes] = None,
+        retry_policy: RetryPolicy = None,
+        dead_letters: DeadLetters = None,
+        address: str = None,
+    ):
+        self.ip = ip
+        self.port = port
+        self.address = address or ip
+        self.greeting = greeting
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.dead_letters = dead_letters or DeadLetters()
+        self.breaker = CircuitBreaker()
+        self.queue: Queue = Queue(maxsize=SEND_QUEUE_SIZE)
+        self.sock: Optional[socket.socket] = None
+        self.connected = False
+        self.consecutive_failures = 0
+        self.total_failures = 0
+        self.dropped = 0
+        self.sent = 0
+        self.last_success = 0.0
+        self.last_failure = 0.0
+        self.closed = False
+        self.writer = Thread(target=self._write_loop, daemon=True)
+        self.writer.start()
+
+    def enqueue(self, payload: bytes) -> bool:
+        # while the breaker is open nothing is queued, so a dead peer can't hold thousands of frames
+        if self.breaker.is_open():
+            self._give_up(len(payload), "circuit open")
+            return False
+        try:
+            self.queue.put_nowait(pack_frame(payload))
+            return True
+        except Full:
+            self._give_up(len(payload), "queue full")
+            return False
+
+    def _give_up(self, payload_size: int, reason: str) -> None:
+        self.dropped += 1
+        self.dead_letters.add(self.address, payload_size, reason)
+
+    def close(self) -> None:
+        self.closed = True
+        try:
+            self.queue.put_nowait(None)
+        except Full:
+            pass
+
+    def is_healthy(self) -> bool:
+        return self.consecutive_failures == 0
+
+    def get_health(self) -> dict:
+        return {
+            "connected": self.connected,
+            "healthy": self.is_healthy(),
+            "circuit": self.breaker.state,
+            "consecutive_failures": self.consecutive_failures,
+            "total_failures": self.total_failures,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "queued": self.queue.qsize(),
+        }
+
+    def _connect(self) -> None:
+        sock = socket.create_connection((self.ip, self.port), timeout=CONNECT_TIMEOUT)
+        sock.settimeout(None)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        if self.greeting is not None:
+            sock.sendall(pack_frame(self.greeting))
+        self.sock = sock
+        self.connected = True
+
+    def _disconnect(self) -> None:
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+        self.sock = None
+        self.connected = False
+
+    def _write_loop(self) -> None:
+        while True:
+            frame = self.queue.get()
+            if self.closed:
+                self._disconnect()
+                return
+            payload_size = len(frame) - FRAME_HEADER.size
+            if not self.breaker.allow():
+                self._give_up(payload_size, "circuit open")
+                continue
+
+            for attempt in range(self.retry_policy.max_attempts):
+                try:
+                    if self.sock is None:
+                        self._connect()
+                    self.sock.sendall(frame)
+                    self.sent += 1
+                    self.consecutive_failures = 0
+                    self.last_success = time.time()
+                    self.breaker.record_success()
+                    break
+                except OSError:
+                    self._disconnect()
+                    self.consecutive_failures += 1
+                    self.total_failures += 1
+                    self.last_failure = time.time()
+                    self.breaker.record_failure()
+                    if not self.breaker.allow():
+                        self._give_up(payload_size, "circuit open")
+                        break
+                    if attempt + 1 < self.retry_policy.max_attempts:
+                        time.sleep(self.retry_policy.backoff(attempt))
+            else:
+                self._give_up(payload_size, "retries exhausted")
+
+
+class ConnectionPool:
+    def __init__(self, port: int, greeting: Optional[bytes] = None, retry_policy: RetryPolicy = None, dead_letters: DeadLetters = None):
+        self.port = port
+        self.greeting = greeting
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.dead_letters = dead_letters or DeadLetters()
+        self.connections: Dict[str, PeerConnection] = {}
+        # failures of removed connections, so the pool's total never goes down
+        self.removed_failures = 0
+        self.lock = Lock()
+
+    def get_connection(self, ip: str) -> PeerConnection:
+        connection = self.connections.get(ip)
+        if connection is None:
+            with self.lock:
+                connection = self.connections.get(ip)
+                if connection is None:
+                    host, port = split_address(ip, self.port)
+                    connection = PeerConnection(host, port, self.greeting, self.retry_policy, self.dead_letters, ip)
+                    self.connections[ip] = connection
+        return connection
+
+    def remove(self, ip: str) -> None:
+        with self.lock:
+            connection = self.connections.pop(ip, None)
+            if connection is not None:
+                self.removed_failures += connection.total_failures
+        if connection is not None:
+            connection.close()
+
+    def send(self, ip: str, payload: bytes) -> bool:
+        return self.get_connection(ip).enqueue(payload)
+
+    def get_health(self) -> Dict[str, dict]:
+        return {ip: connection.get_health() for ip, connection in list(self.connections.items())}
+
+    def get_total_failures(self) -> int:
+        with self.lock:
+            return self.removed_failures + sum(connection.total_failures for connection in self.connections.values())
@@ -0,0 +1,70 @@
+from constants import (
+    STATUS_HEARTBEAT_INTERVAL,
+    PHI_THRESHOLD,
+    PHI_WINDOW_SIZE,
+    PHI_MIN_STD_DEV,
+    PHI_ACCEPTABLE_PAUSE,
+)
+
+from collections import deque
+from threading import Lock
+from typing import Deque, Dict, List
+import math
+import time
+
+
+class HeartbeatHistory:
+    def __init__(self, first_heartbeat: float):
+        # seeded with the expected interval so a fresh peer isn't suspected before it has a history
+        self.last_heartbeat = first_heartbeat
+        self.intervals: Deque[float] = deque([STATUS_HEARTBEAT_INTERVAL], maxlen=PHI_WINDOW_SIZE)
+
+    def add(self, now: float) -> None:
+        self.intervals.append(now - self.last_heartbeat)
+        self.last_heartbeat = now
+
+    def phi(self, now: float) -> float:
+        # phi accrual: -log10 of the probability that a heartbeat arrives even later than this
+        mean = sum(self.intervals) / len(self.intervals)
+        variance = sum((interval - mean) ** 2 for interval in self.intervals) / len(self.intervals)
+        std_dev = max(PHI_MIN_STD_DEV, math.sqrt(variance))
+        y = (now - self.last_heartbeat - mean - PHI_ACCEPTABLE_PAUSE) / std_dev
+        if y < -10:
+            return 0.0
+        e = math.exp(-y * (1.5976 + 0.070566 * y * y))
+        if y > 0:
+            return -math.log10(e / (1.0 + e)) if e > 0 else float("inf")
+        return -math.log10(1.0 - 1.0 / (1.0 + e))
+
+
+class FailureDetector:
+    def __init__(self, threshold: float = PHI_THRESHOLD):
+        self.threshold = threshold
+        self.lock = Lock()
+        self.histories: Dict[str, HeartbeatHistory] = {}
+
+    def heartbeat(self, ip: str) -> None:
+        now = time.time()
+        with self.lock:
+            history = self.histories.get(ip)
+            if history is None:
+                self.histories[ip] = HeartbeatHistory(now)
+            else:
+                history.add(now)
+
+    def remove(self, ip: str) -> None:
+        with self.lock:
+            self.histories.pop(ip, None)
+
+    def phi(self, ip: str) -> float:
+        with self.lock:
+            history = self.histories.get(ip)
+            return history.phi(time.time()) if history is not None else 0.0
+
+    def get_suspects(self, peers: List[str]) -> List[str]:
+        return [ip for ip in peers if self.phi(ip) > self.threshold]
+
+    def get_phis(self) -> Dict[str, float]:
+        now = time.time()
+        with self.lock:
+            return {ip: round(history.phi(now), 2) for ip, history in self.histories.items()}
@@ -0,0 +1,86 @@
+from constants import (
+    FRAGMENT_MAGIC,
+    MAX_REASSEMBLY_BYTES,
+    REASSEMBLY_TIMEOUT,
+)
+
+import random
+import struct
+import time
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+
+FRAGMENT_HEADER = struct.Struct("!BIHH")
+
+
+def fragment(payload: bytes, max_size: int) -> List[bytes]:
+    if len(payload) <= max_size:
+        return [payload]
+
+    piece_size = max_size - FRAGMENT_HEADER.size
+    count = (len(payload) + piece_size - 1) // piece_size
+    message_id = random.getrandbits(32)
+    fragments = []
+    for index in range(count):
+        piece = payload[index * piece_size : (index + 1) * piece_size]
+        fragments.append(FRAGMENT_HEADER.pack(FRAGMENT_MAGIC, message_id, index, count) + piece)
+    return fragments
+
+
+def is_fragment(data: bytes) -> bool:
+    return len(data) >= FRAGMENT_HEADER.size and data[0] == FRAGMENT_MAGIC
+
+
+class PartialMessage:
+    def __init__(self, count: int):
+        self.count = count
+        self.parts: Dict[int, bytes] = {}
+        self.size = 0
+        self.first_seen = time.time()
+
+
+class Reassembler:
+    def __init__(self, max_bytes: int = MAX_REASSEMBLY_BYTES, timeout: float = REASSEMBLY_TIMEOUT):
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.partials: Dict[Tuple[str, int], PartialMessage] = {}
+        self.buffered_bytes = 0
+        self.dropped = 0
+        self.lock = Lock()
+
+    def add(self, ip: str, data: bytes) -> Optional[bytes]:
+        if not is_fragment(data):
+            return data
+
+        _, message_id, index, count = FRAGMENT_HEADER.unpack_from(data, 0)
+        piece = bytes(data[FRAGMENT_HEADER.size :])
+        key = (ip, message_id)
+        with self.lock:
+            self._evict(len(piece))
+
+            partial = self.partials.get(key)
+            if partial is None:
+                partial = PartialMessage(count)
+                self.partials[key] = partial
+            if index in partial.parts or index >= partial.count:
+                return None
+
+            partial.parts[index] = piece
+            partial.size += len(piece)
+            self.buffered_bytes += len(piece)
+            if len(partial.parts) < partial.count:
+                return None
+
+            del self.partials[key]
+            self.buffered_bytes -= partial.size
+        return b"".join(partial.parts[i] for i in range(partial.count))
+
+    def _evict(self, incoming_size: int) -> None:
+        now = time.time()
+        for key in list(self.partials):
+            partial = self.partials[key]
+            expired = now - partial.first_seen > self.timeout
+            if expired or self.buffered_bytes + incoming_size > self.max_bytes:
+                del self.partials[key]
+                self.buffered_bytes -= partial.size
+                self.dropped += 1
@@ -0,0 +1,37 @@
+from constants import MAX_FRAME_SIZE
+
+import socket
+import struct
+from typing import Optional
+
+FRAME_HEADER = struct.Struct("!I")
+
+
+def pack_frame(payload: bytes) -> bytes:
+    return FRAME_HEADER.pack(len(payload)) + payload
+
+
+def recv_exact(conn: socket.socket, size: int) -> Optional[bytearray]:
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = conn.recv_into(view[received:], size - received)
+        if count == 0:
+            return None
+        received += count
+    return buffer
+
+
+def recv_frame(conn: socket.socket) -> Optional[bytearray]:
+    header = recv_exact(conn, FRAME_HEADER.size)
+    if header is None:
+        return None
+    (length,) = FRAME_HEADER.unpack(header)
+    check_frame_length(length)
+    return recv_exact(conn, length)
+
+
+def check_frame_length(length: int) -> None:
+    if length > MAX_FRAME_SIZE:
+        raise ConnectionError(f"frame of {length} bytes exceeds limit of {MAX_FRAME_SIZE}")
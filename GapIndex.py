@@ -0,0 +1,78 @@
+from bisect import bisect_left, bisect_right
+from typing import List
+
+NonceRange = List[int]
+
+
+def split_nonce_ranges(nonce_ranges: List[NonceRange], chunk_size: int) -> List[List[NonceRange]]:
+    # consecutive slices covering at most chunk_size nonces each, in request order
+    chunks: List[List[NonceRange]] = []
+    chunk: List[NonceRange] = []
+    room = chunk_size
+    for start, end in nonce_ranges:
+        while start < end:
+            stop = min(end, start + room)
+            chunk.append([start, stop])
+            room -= stop - start
+            start = stop
+            if room == 0:
+                chunks.append(chunk)
+                chunk = []
+                room = chunk_size
+    if len(chunk) > 0:
+        chunks.append(chunk)
+    return chunks
+
+
+class GapIndex:
+    def __init__(self, watermark: int = 0):
+        self.watermark = watermark
+        self.starts: List[int] = []
+        self.ends: List[int] = []
+
+    def add(self, nonce: int) -> None:
+        self.add_range(nonce, nonce + 1)
+
+    def add_range(self, start: int, end: int) -> None:
+        if end <= self.watermark:
+            return
+        start = max(start, self.watermark)
+
+        # intervals overlapping or touching [start, end) are folded into a single one
+        first = bisect_left(self.ends, start)
+        last = bisect_right(self.starts, end)
+        if first < last:
+            start = min(start, self.starts[first])
+            end = max(end, self.ends[last - 1])
+        self.starts[first:last] = [start]
+        self.ends[first:last] = [end]
+
+        if self.starts[0] <= self.watermark:
+            self.watermark = self.ends[0]
+            del self.starts[0]
+            del self.ends[0]
+
+    def __contains__(self, nonce: int) -> bool:
+        if nonce < self.watermark:
+            return True
+        index = bisect_right(self.starts, nonce) - 1
+        return index >= 0 and nonce < self.ends[index]
+
+    def get_high_water(self) -> int:
+        return self.ends[-1] if self.ends else self.watermark
+
+    def get_missing_ranges(self, up_to: int = None) -> List[NonceRange]:
+        missing: List[NonceRange] = []
+        previous_end = self.watermark
+        for start, end in zip(self.starts, self.ends):
+            if up_to is not None and start >= up_to:
+                break
+            missing.append([previous_end, start])
+            previous_end = end
+
+        if up_to is not None and previous_end < up_to:
+            missing.append([previous_end, up_to])
+        return missing
+
+    def get_missing_count(self, up_to: int = None) -> int:
+        return sum(end - start for start, end in self.get_missing_ranges(up_to))
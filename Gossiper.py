@@ -0,0 +1,211 @@
+from constants import (
+    MSG_HELLO,
+    STATUS_READY,
+    GOSSIP_FANOUT,
+    GOSSIP_INTERVAL,
+    GOSSIP_MAX_OPERATIONS,
+    HELLO_INTERVAL_MAX,
+    SYNC_RETRY_INTERVAL,
+)
+
+from threading import Event, Lock
+from typing import Dict, List, Tuple
+import random
+import sys
+import time
+from Msg import Msg
+
+# node -> [heartbeat, status, incarnation]; the origin bumps its heartbeat every round and on every status change
+Members = Dict[str, list]
+# variable -> node -> [nonce after the highest one held, missing ranges below it]
+Digests = Dict[str, Dict[str, list]]
+# variable -> origin -> [incarnation, runs of operations in the update batch layout]
+Operations = Dict[str, Dict[str, list]]
+
+
+class Gossiper:
+    def __init__(self, network_manager, fanout: int = GOSSIP_FANOUT, interval: float = GOSSIP_INTERVAL, seeds: List[str] = None):
+        self.network_manager = network_manager
+        self.fanout = fanout
+        self.interval = interval
+        self.seeds = seeds or []
+        self.enabled = fanout > 0
+        self.lock = Lock()
+        self.wake = Event()
+        self.heartbeat = 0
+        self.announced_status = None
+        self.members: Members = {}
+        # (peer, variable, origin) -> (nonce after the last operation sent, when the retry window opened)
+        self.sent: Dict[Tuple[str, str, str], Tuple[int, float]] = {}
+        self.rounds = 0
+        self.relayed = 0
+
+    def pick_peers(self) -> List[str]:
+        peers = list(self.network_manager.peers)
+        return random.sample(peers, min(self.fanout, len(peers)))
+
+    def push(self, msg: Msg) -> None:
+        # a fresh update only goes to fanout peers, the push-pull rounds carry it the rest of the way
+        for node_id in self.pick_peers():
+            self.network_manager.send_threaded(msg, node_id)
+
+    def announce(self, status: str) -> None:
+        # a status change starts a round right away instead of waiting for the next one
+        with self.lock:
+            if status == self.announced_status:
+                return
+            self.announced_status = status
+            self.heartbeat += 1
+        self.wake.set()
+
+    def run(self) -> None:
+        while True:
+            self.wake.wait(self.interval * random.uniform(0.75, 1.25))
+            self.wake.clear()
+            try:
+                self.gossip_round()
+            except Exception as e:
+                print("gossip exception:", e)
+
+    def gossip_round(self) -> None:
+        network_manager = self.network_manager
+        expired = time.time() - SYNC_RETRY_INTERVAL
+        with self.lock:
+            self.heartbeat += 1
+            self.rounds += 1
+            self.sent = {key: entry for key, entry in self.sent.items() if entry[1] > expired}
+        self._contact_seeds()
+        msg = self._gossip_msg()
+        for node_id in self.pick_peers():
+            network_manager.send_threaded(msg, node_id)
+
+    def _contact_seeds(self) -> None:
+        # seeds may sit behind a router the hello broadcast never crosses
+        for seed in self.seeds:
+            if seed not in self.network_manager.peers:
+                self._send_hello(seed)
+
+    def _send_hello(self, node_id: str) -> None:
+        network_manager = self.network_manager
+        if network_manager.outbound_tracker.try_acquire((node_id, MSG_HELLO), HELLO_INTERVAL_MAX, False):
+            msg = Msg().init_hello(network_manager.ip, network_manager.current_status, network_manager.wire_formats, network_manager.incarnation)
+            network_manager.send_threaded(msg, node_id)
+
+    def _gossip_msg(self, digests: Digests = None, operations: Operations = None, is_reply: bool = False) -> Msg:
+        # only live peers are passed on, so evicted nodes drop out of everyone's table
+        network_manager = self.network_manager
+        with self.lock:
+            members = {node_id: list(entry) for node_id, entry in self.members.items() if node_id in network_manager.peers}
+            members[network_manager.ip] = [self.heartbeat, network_manager.current_status, network_manager.incarnation]
+        if digests is None and not is_reply:
+            digests = self._digests()
+        return Msg().init_gossip(members, digests, operations, is_reply)
+
+    def _digests(self) -> Digests:
+        network_manager = self.network_manager
+        digests: Digests = {}
+        for variable_name, crdt in network_manager.variable_name_to_object.items():
+            digests[variable_name] = crdt.get_digest(network_manager.ip)
+        return digests
+
+    def handle_gossip(self, msg: Msg, ip: str) -> None:
+        # push-pull in three steps: a digest, the answer with our digest and what the initiator lacks,
+        # and the initiator's closing message with what we lack
+        network_manager = self.network_manager
+        self._merge_members(msg["members"])
+        if network_manager.current_status == STATUS_READY:
+            # the round's values are being agreed on, only the statuses may change now
+            return
+        operations = msg.get("operations")
+        if operations:
+            self._apply_operations(operations, ip)
+        digests = msg.get("digests")
+        if digests is None:
+            return
+        operations = self._collect_missing(digests, ip)
+        if msg.get("is_reply"):
+            if operations:
+                network_manager.send_threaded(self._gossip_msg(operations=operations, is_reply=True), ip)
+        else:
+            network_manager.send_threaded(self._gossip_msg(self._digests(), operations, True), ip)
+
+    def _merge_members(self, members: Members) -> None:
+        network_manager = self.network_manager
+        for node_id, (heartbeat, status, incarnation) in members.items():
+            if node_id == network_manager.ip:
+                continue
+            with self.lock:
+                known = self.members.get(node_id)
+                if known is not None and (incarnation, heartbeat) <= (known[2], known[0]):
+                    continue
+                self.members[node_id] = [heartbeat, status, incarnation]
+            if incarnation < network_manager.peer_incarnations.get(node_id, incarnation):
+                continue
+            network_manager._check_incarnation(node_id, incarnation)
+            if node_id in network_manager.peers:
+                # a newer heartbeat passed on by anyone proves the node alive, without it messaging us directly
+                network_manager.failure_detector.heartbeat(node_id)
+                network_manager.peers[node_id] = status
+            else:
+                self._send_hello(node_id)
+
+    def _apply_operations(self, operations: Operations, ip: str) -> None:
+        network_manager = self.network_manager
+        for variable_name, origins in operations.items():
+            crdt = network_manager.variable_name_to_object.get_or_create(variable_name)
+            for origin, (incarnation, nonce_ranges) in origins.items():
+                # operations of an incarnation we don't know would collide with the nonces of the one we do
+                if origin == network_manager.ip or incarnation != network_manager.peer_incarnations.get(origin):
+                    continue
+                crdt.apply_update_batch(origin, nonce_ranges)
+                if origin != ip:
+                    self.relayed += sum(len(operation_values) for _, operation_values in nonce_ranges)
+
+    def _collect_missing(self, digests: Digests, ip: str) -> Operations:
+        # whatever the digest lacks, from every origin we know, bounded so one exchange never grows past a chunk
+        network_manager = self.network_manager
+        operations: Operations = {}
+        budget = GOSSIP_MAX_OPERATIONS
+        now = time.time()
+        for variable_name, crdt in network_manager.variable_name_to_object.items():
+            digest = digests.get(variable_name)
+            if digest is None:
+                # the variable is new to the sender, it needs our before_sync_value along with our operations
+                for msg in network_manager._sync_data_messages(variable_name, crdt):
+                    network_manager.send_threaded(msg, ip)
+            for origin in crdt.get_digest(network_manager.ip):
+                if origin == ip or (digest is None and origin == network_manager.ip):
+                    continue
+                incarnation = network_manager.incarnation if origin == network_manager.ip else network_manager.peer_incarnations.get(origin)
+                if incarnation is None:
+                    continue
+                high_water, missing_ranges = (digest or {}).get(origin, [0, []])
+                key = (ip, variable_name, origin)
+                with self.lock:
+                    sent_up_to, window_start = self.sent.get(key, (0, 0.0))
+                if now - window_start < SYNC_RETRY_INTERVAL:
+                    # what we sent a moment ago may still wait in the peer's queue, its digest can't show it yet
+                    nonce_ranges = crdt.get_node_operations(origin, [[max(high_water, sent_up_to), sys.maxsize]], budget)
+                else:
+                    window_start = now
+                    nonce_ranges = crdt.get_node_operations(origin, missing_ranges + [[high_water, sys.maxsize]], budget)
+                if len(nonce_ranges) == 0:
+                    continue
+                last_start, last_values = nonce_ranges[-1]
+                with self.lock:
+                    self.sent[key] = (last_start + len(last_values), window_start)
+                operations.setdefault(variable_name, {})[origin] = [incarnation, nonce_ranges]
+                budget -= sum(len(operation_values) for _, operation_values in nonce_ranges)
+                if budget <= 0:
+                    return operations
+        return operations
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {
+                "fanout": self.fanout,
+                "heartbeat": self.heartbeat,
+                "rounds": self.rounds,
+                "members": len(self.members),
+                "relayed_operations": self.relayed,
+            }
@@ -0,0 +1,133 @@
+from constants import INMEMORY_REORDER_DELAY
+
+import heapq
+import random
+import time
+from collections import Counter
+from threading import Condition, Lock, Thread
+from typing import Callable, Dict, List, Optional, Tuple
+from Transport import Transport
+
+# (deliver at, sequence, source address, payload)
+Delivery = Tuple[float, int, str, bytes]
+
+
+class InMemoryNetwork:
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        loss: float = 0.0,
+        reorder: float = 0.0,
+        reorder_delay: float = INMEMORY_REORDER_DELAY,
+        seed: Optional[int] = None,
+        classify: Callable[[bytes], str] = None,
+    ):
+        # a seeded random source decides loss, jitter and reordering, so a lossy run can be repeated
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.reorder = reorder
+        self.reorder_delay = reorder_delay
+        self.random = random.Random(seed)
+        self.classify = classify
+        self.lock = Lock()
+        self.transports: Dict[str, "InMemoryTransport"] = {}
+        self.sequence = 0
+        self.last_delivery: Dict[Tuple[str, str], float] = {}
+        self.message_counts: Counter = Counter()
+        self.byte_counts: Counter = Counter()
+        self.dropped = 0
+
+    def attach(self, transport: "InMemoryTransport") -> None:
+        with self.lock:
+            self.transports[transport.address] = transport
+
+    def detach(self, address: str) -> None:
+        with self.lock:
+            self.transports.pop(address, None)
+
+    def send(self, source: str, destination: str, payload: bytes, is_datagram: bool = False) -> None:
+        # unicast behaves like TCP: reliable and in order per pair; only datagrams are lost or reordered
+        transport = self.transports.get(destination)
+        if transport is None:
+            return
+
+        with self.lock:
+            msg_type = self.classify(payload) if self.classify is not None else ""
+            self.message_counts[msg_type] += 1
+            self.byte_counts[msg_type] += len(payload)
+            deliver_at = time.time() + self.latency
+            if self.jitter > 0:
+                deliver_at += self.random.uniform(0, self.jitter)
+            if is_datagram:
+                if self.loss > 0 and self.random.random() < self.loss:
+                    self.dropped += 1
+                    return
+                if self.reorder > 0 and self.random.random() < self.reorder:
+                    deliver_at += self.reorder_delay
+            else:
+                deliver_at = max(deliver_at, self.last_delivery.get((source, destination), 0.0))
+                self.last_delivery[(source, destination)] = deliver_at
+            self.sequence += 1
+            sequence = self.sequence
+        transport.deliver((deliver_at, sequence, source, payload))
+
+    def broadcast(self, source: str, payload: bytes) -> None:
+        for destination in list(self.transports):
+            if destination != source:
+                self.send(source, destination, payload, True)
+
+    def reset_counters(self) -> None:
+        with self.lock:
+            self.message_counts = Counter()
+            self.byte_counts = Counter()
+            self.dropped = 0
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {
+                "messages": sum(self.message_counts.values()),
+                "bytes": sum(self.byte_counts.values()),
+                "dropped": self.dropped,
+                "messages_by_type": dict(self.message_counts),
+                "bytes_by_type": dict(self.byte_counts),
+            }
+
+
+class InMemoryTransport(Transport):
+    def __init__(self, network: InMemoryNetwork, address: str):
+        super().__init__(address)
+        self.network = network
+        self.condition = Condition()
+        self.pending: List[Delivery] = []
+        network.attach(self)
+
+    def start(self, receive) -> None:
+        super().start(receive)
+        Thread(target=self._deliver_loop, daemon=True).start()
+
+    def send(self, address: str, payload: bytes) -> None:
+        self.network.send(self.address, address, payload)
+
+    def broadcast(self, payload: bytes) -> None:
+        self.network.broadcast(self.address, payload)
+
+    def deliver(self, delivery: Delivery) -> None:
+        with self.condition:
+            heapq.heappush(self.pending, delivery)
+            self.condition.notify()
+
+    def _deliver_loop(self) -> None:
+        while True:
+            with self.condition:
+                while True:
+                    now = time.time()
+                    if self.pending and self.pending[0][0] <= now:
+                        _, _, source, payload = heapq.heappop(self.pending)
+                        break
+                    self.condition.wait(self.pending[0][0] - now if self.pending else None)
+            try:
+                self.receive(payload, source)
+            except Exception as e:
+                print(end="")
@@ -0,0 +1,174 @@
+from constants import (
+    MSG_HELLO,
+    MSG_HELLO_RECEIVED,
+    MSG_STATUS,
+    MSG_STATUS_REQUEST,
+    MSG_START_SYNC,
+    MSG_STOP_SYNC,
+    MSG_SYNC_MISMATCH_REQUEST,
+    MSG_SYNC_MISMATCH_DATA,
+    MSG_CHECKPOINT_PROPOSE,
+    MSG_CHECKPOINT_VOTE,
+    MSG_CHECKPOINT_COMMIT,
+    MSG_VARIABLE_UPDATE,
+    MSG_VARIABLE_UPDATE_BATCH,
+    MSG_NONCE_REQUEST,
+    MSG_NONCE_SEND,
+    MSG_SYNC_DATA,
+    MSG_VERSION_VECTOR,
+    MSG_GOSSIP,
+    PRIORITY_CONTROL,
+    PRIORITY_UPDATE,
+    PRIORITY_BULK,
+    DROP_POLICY_BLOCK,
+    DROP_POLICY_DROP_NEWEST,
+    DROP_POLICY_DROP_LOWEST,
+)
+
+from collections import deque
+from threading import Condition, Lock, Thread
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+import time
+from Msg import Msg
+
+# anything that feeds or ends a sync round shares one FIFO class, a reset must never overtake the round's data
+MSG_PRIORITIES = {
+    MSG_HELLO: PRIORITY_CONTROL,
+    MSG_HELLO_RECEIVED: PRIORITY_CONTROL,
+    MSG_STATUS: PRIORITY_CONTROL,
+    MSG_STATUS_REQUEST: PRIORITY_CONTROL,
+    MSG_SYNC_MISMATCH_REQUEST: PRIORITY_CONTROL,
+    MSG_CHECKPOINT_PROPOSE: PRIORITY_CONTROL,
+    MSG_CHECKPOINT_VOTE: PRIORITY_CONTROL,
+    MSG_GOSSIP: PRIORITY_CONTROL,
+    MSG_VARIABLE_UPDATE: PRIORITY_UPDATE,
+    MSG_VARIABLE_UPDATE_BATCH: PRIORITY_UPDATE,
+    MSG_SYNC_DATA: PRIORITY_UPDATE,
+    MSG_NONCE_SEND: PRIORITY_UPDATE,
+    MSG_START_SYNC: PRIORITY_UPDATE,
+    MSG_STOP_SYNC: PRIORITY_UPDATE,
+    MSG_SYNC_MISMATCH_DATA: PRIORITY_UPDATE,
+    MSG_CHECKPOINT_COMMIT: PRIORITY_UPDATE,
+    MSG_NONCE_REQUEST: PRIORITY_BULK,
+    MSG_VERSION_VECTOR: PRIORITY_BULK,
+}
+PRIORITY_LEVELS = [PRIORITY_CONTROL, PRIORITY_UPDATE, PRIORITY_BULK]
+PRIORITY_NAMES = ["control", "update", "bulk"]
+
+InboundItem = Tuple[Msg, str]
+MessageHandler = Callable[[Msg, str], None]
+
+
+class InboundPartition:
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.condition = Condition()
+        self.queues: List[Deque[InboundItem]] = [deque() for _ in PRIORITY_LEVELS]
+        self.size = 0
+
+    def put(self, item: InboundItem, priority: int, drop_policy: str, block: bool) -> Tuple[bool, Optional[InboundItem]]:
+        # returns whether the item was queued and the item that was dropped to make room, if any
+        with self.condition:
+            evicted = None
+            if self.size >= self.max_size:
+                if drop_policy == DROP_POLICY_BLOCK and block:
+                    self.condition.wait_for(lambda: self.size < self.max_size)
+                elif drop_policy == DROP_POLICY_DROP_NEWEST or drop_policy == DROP_POLICY_BLOCK:
+                    return False, None
+                else:
+                    evicted = self._evict_below(priority)
+                    if evicted is None:
+                        return False, None
+
+            self.queues[priority].append(item)
+            self.size += 1
+            self.condition.notify_all()
+            return True, evicted
+
+    def _evict_below(self, priority: int) -> Optional[InboundItem]:
+        for lower_priority in range(len(self.queues) - 1, priority, -1):
+            if self.queues[lower_priority]:
+                self.size -= 1
+                return self.queues[lower_priority].pop()
+        return None
+
+    def get(self) -> InboundItem:
+        with self.condition:
+            self.condition.wait_for(lambda: self.size > 0)
+            for queue in self.queues:
+                if queue:
+                    self.size -= 1
+                    self.condition.notify_all()
+                    return queue.popleft()
+
+    def get_depths(self) -> List[int]:
+        with self.condition:
+            return [len(queue) for queue in self.queues]
+
+
+class InboundQueue:
+    def __init__(self, handler: MessageHandler, worker_count: int, max_size: int, drop_policy: str = DROP_POLICY_DROP_LOWEST):
+        # messages of one peer always land on the same worker, so they are handled in arrival order within a priority
+        self.handler = handler
+        self.drop_policy = drop_policy
+        self.partitions = [InboundPartition(max(1, max_size // worker_count)) for _ in range(worker_count)]
+        self.metrics_lock = Lock()
+        self.enqueued = 0
+        self.handled = 0
+        self.dropped: Dict[str, int] = {}
+        self.max_depth = 0
+        self.handle_time = 0.0
+        self.errors = 0
+        for partition in self.partitions:
+            Thread(target=self._worker_loop, args=(partition,), daemon=True).start()
+
+    def put(self, msg: Msg, ip: str, block: bool = True) -> bool:
+        partition = self.partitions[hash(ip) % len(self.partitions)]
+        priority = MSG_PRIORITIES.get(msg["msg_type"], PRIORITY_UPDATE)
+        is_queued, evicted = partition.put((msg, ip), priority, self.drop_policy, block)
+
+        with self.metrics_lock:
+            if is_queued:
+                self.enqueued += 1
+                self.max_depth = max(self.max_depth, partition.size)
+            else:
+                self._count_drop(msg)
+            if evicted is not None:
+                self._count_drop(evicted[0])
+        return is_queued
+
+    def _count_drop(self, msg: Msg) -> None:
+        msg_type = msg["msg_type"]
+        self.dropped[msg_type] = self.dropped.get(msg_type, 0) + 1
+
+    def _worker_loop(self, partition: InboundPartition) -> None:
+        while True:
+            msg, ip = partition.get()
+            started = time.time()
+            is_failed = False
+            try:
+                self.handler(msg, ip)
+            except Exception as e:
+                is_failed = True
+            with self.metrics_lock:
+                self.errors += is_failed
+                self.handled += 1
+                self.handle_time += time.time() - started
+
+    def get_stats(self) -> dict:
+        depths = [0 for _ in PRIORITY_LEVELS]
+        for partition in self.partitions:
+            for priority, depth in enumerate(partition.get_depths()):
+                depths[priority] += depth
+
+        with self.metrics_lock:
+            return {
+                "workers": len(self.partitions),
+                "depths": depths,
+                "max_depth": self.max_depth,
+                "enqueued": self.enqueued,
+                "handled": self.handled,
+                "dropped": dict(self.dropped),
+                "errors": self.errors,
+                "average_handle_time": self.handle_time / self.handled if self.handled else 0.0,
+            }
@@ -0,0 +1,167 @@
+from constants import (
+    METRICS_NAMESPACE,
+    LATENCY_BUCKETS,
+)
+
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from typing import Callable, Dict, List, Tuple
+
+COUNTER = "counter"
+GAUGE = "gauge"
+HISTOGRAM = "histogram"
+
+# name: (kind, label name, help)
+METRIC_DEFINITIONS = {
+    "messages_sent_total": (COUNTER, "type", "Messages handed to the transport, a broadcast counts once"),
+    "bytes_sent_total": (COUNTER, "type", "Encoded bytes handed to the transport"),
+    "messages_received_total": (COUNTER, "type", "Messages decoded from the transport"),
+    "bytes_received_total": (COUNTER, "type", "Encoded bytes received"),
+    "handler_seconds": (HISTOGRAM, "type", "Time spent handling one message"),
+    "sync_phase_seconds": (HISTOGRAM, "phase", "Time spent in one full-sync phase"),
+    "send_failures_total": (COUNTER, "", "Failed TCP send attempts that were retried"),
+    "outbound_retries_total": (COUNTER, "", "Tracked requests sent again after their retry timer ran out"),
+    "outbound_suppressed_total": (COUNTER, "", "Tracked requests held back while an identical one was in flight"),
+    "inbound_queue_depth": (GAUGE, "priority", "Messages waiting in the inbound queue"),
+    "inbound_dropped_total": (COUNTER, "type", "Messages dropped by a full inbound queue"),
+    "circuits_open": (GAUGE, "", "Peers whose circuit breaker currently rejects sends"),
+    "dead_letters_total": (COUNTER, "peer", "Unicast messages given up on after retries or while the circuit was open"),
+    "handler_errors_total": (COUNTER, "", "Messages whose handler raised"),
+    "history_size": (GAUGE, "variable", "Operations kept in a variable's histories"),
+    "peers": (GAUGE, "", "Known peers"),
+    "sync_round": (GAUGE, "", "Full-sync round this node is in"),
+}
+
+MetricKey = Tuple[str, str]
+# collectors are called on every scrape and return (name, label value, value) samples
+Collector = Callable[[], List[Tuple[str, str, float]]]
+
+
+def escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Histogram:
+    def __init__(self, buckets: List[float]):
+        self.buckets = buckets
+        self.counts = [0 for _ in range(len(buckets) + 1)]
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+
+class Metrics:
+    def __init__(self, enabled: bool = True, buckets: List[float] = LATENCY_BUCKETS):
+        # hot paths check `enabled` first, so a disabled instance costs one attribute lookup per call
+        self.enabled = enabled
+        self.buckets = buckets
+        self.lock = Lock()
+        self.counters: Dict[MetricKey, float] = {}
+        self.histograms: Dict[MetricKey, Histogram] = {}
+        self.collectors: List[Collector] = []
+        self.server = None
+
+    def inc(self, name: str, label: str = "", value: float = 1) -> None:
+        if not self.enabled:
+            return
+        key = (name, label)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, label: str = "") -> None:
+        if not self.enabled:
+            return
+        key = (name, label)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    def add_collector(self, collector: Collector) -> None:
+        self.collectors.append(collector)
+
+    def _collect(self) -> Dict[MetricKey, float]:
+        with self.lock:
+            samples = dict(self.counters)
+        for collector in self.collectors:
+            try:
+                for name, label, value in collector():
+                    samples[(name, label)] = value
+            except Exception as e:
+                print("metrics collector exception:", e)
+        return samples
+
+    def _histograms(self) -> Dict[MetricKey, Tuple[List[int], int, float]]:
+        with self.lock:
+            return {key: (list(histogram.counts), histogram.count, histogram.sum) for key, histogram in self.histograms.items()}
+
+    def render(self) -> str:
+        # Prometheus text exposition format
+        samples = self._collect()
+        histograms = self._histograms()
+        lines = []
+        for name, (kind, label_name, help_text) in METRIC_DEFINITIONS.items():
+            full_name = f"{METRICS_NAMESPACE}_{name}"
+            if kind == HISTOGRAM:
+                keys = sorted(key for key in histograms if key[0] == name)
+            else:
+                keys = sorted(key for key in samples if key[0] == name)
+            if len(keys) == 0:
+                continue
+
+            lines.append(f"# HELP {full_name} {help_text}")
+            lines.append(f"# TYPE {full_name} {kind}")
+            for key in keys:
+                label = f'{label_name}="{escape_label_value(key[1])}"' if label_name else ""
+                if kind != HISTOGRAM:
+                    lines.append(f"{full_name}{{{label}}} {samples[key]}" if label else f"{full_name} {samples[key]}")
+                    continue
+
+                counts, count, total = histograms[key]
+                separator = "," if label else ""
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + [float("inf")], counts):
+                    cumulative += bucket_count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'{full_name}_bucket{{{label}{separator}le="{le}"}} {cumulative}')
+                lines.append(f"{full_name}_sum{{{label}}} {total}" if label else f"{full_name}_sum {total}")
+                lines.append(f"{full_name}_count{{{label}}} {count}" if label else f"{full_name}_count {count}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> List[str]:
+        # short form for the console: plain samples, histograms as count and mean
+        samples = self._collect()
+        lines = []
+        for (name, label), value in sorted(samples.items()):
+            lines.append(f"{name}{'[' + label + ']' if label else ''}: {value:g}")
+        for (name, label), (counts, count, total) in sorted(self._histograms().items()):
+            mean = total / count if count else 0.0
+            lines.append(f"{name}{'[' + label + ']' if label else ''}: count={count} mean={mean * 1000:.3f}ms")
+        return lines
+
+    def serve(self, port: int, host: str = "127.0.0.1") -> None:
+        metrics = self
+
+        class MetricsRequestHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+        Thread(target=self.server.serve_forever, daemon=True).start()
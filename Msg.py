@@ -2,6 +2,7 @@ from constants import (
     MSG_HELLO,
     MSG_HELLO_RECEIVED,
     MSG_VARIABLE_UPDATE,
+    MSG_VARIABLE_UPDATE_BATCH,
     MSG_START_SYNC,
     MSG_STOP_SYNC,
     MSG_STATUS_REQUEST,
@@ -11,44 +12,71 @@ from constants import (
     MSG_SYNC_DATA,
     MSG_SYNC_MISMATCH_DATA,
     MSG_SYNC_MISMATCH_REQUEST,
+    MSG_VERSION_VECTOR,
+    MSG_CHECKPOINT_PROPOSE,
+    MSG_CHECKPOINT_VOTE,
+    MSG_CHECKPOINT_COMMIT,
+    MSG_GOSSIP,
+    WIRE_FORMAT_BINARY,
 )
 
 import json
+import BinaryCodec
+from typing import Optional, Tuple
 
 
 class Msg:
+    __slots__ = ("msg_dict",)
+
     def __init__(self):
         self.msg_dict = {}
 
+    @staticmethod
+    def peek_header(data) -> Tuple[Optional[str], Optional[int]]:
+        # type and sync round of a binary message without decoding its body; JSON has no header to peek at
+        if not BinaryCodec.is_binary(data):
+            return None, None
+        msg_type, sync_round, _ = BinaryCodec.peek_header(data)
+        return msg_type, sync_round
+
     def __getitem__(self, key):
         return self.msg_dict[key]
 
+    def get(self, key, default=None):
+        return self.msg_dict.get(key, default)
+
     def __setitem__(self, key, value):
         self.msg_dict[key] = value
 
     def clear(self):
         self.msg_dict = {}
 
-    def init_hello(self, ip: str, status: str):
+    def init_hello(self, ip: str, status: str, wire_formats: list[str] = None, incarnation: int = None):
         self.clear()
         self.msg_dict["msg_type"] = MSG_HELLO
         self.msg_dict["status"] = status
         self.msg_dict["ip"] = ip
+        if wire_formats is not None:
+            self.msg_dict["wire_formats"] = wire_formats
+        if incarnation is not None:
+            self.msg_dict["incarnation"] = incarnation
         return self
 
-    def init_hello_received(self, status: str):
+    def init_hello_received(self, status: str, wire_formats: list[str] = None, incarnation: int = None):
         self.clear()
         self.msg_dict["msg_type"] = MSG_HELLO_RECEIVED
         self.msg_dict["status"] = status
+        if wire_formats is not None:
+            self.msg_dict["wire_formats"] = wire_formats
+        if incarnation is not None:
+            self.msg_dict["incarnation"] = incarnation
         return self
 
     def init_variable_update(self, variable_name: str, operation: int, nonce: int):
-        self.clear()
-        self.msg_dict["msg_type"] = MSG_VARIABLE_UPDATE
-        self.msg_dict["variable_name"] = variable_name
-        self.msg_dict["operation"] = operation
-        self.msg_dict["nonce"] = nonce
-        return self
+        return VariableUpdateMsg(variable_name, operation, nonce)
+
+    def init_variable_update_batch(self, variable_name: str, nonce_ranges: list):
+        return VariableUpdateBatchMsg(variable_name, nonce_ranges)
 
     def init_start_sync(self, variable_max_nonce_dict):
         self.clear()
@@ -73,26 +101,42 @@ class Msg:
         self.msg_dict["status"] = status
         return self
 
-    def init_nonce_request(self, variable_name: str, nonce_list: list[int]):
+    def init_nonce_request(self, variable_name: str, nonce_ranges: list[list[int]]):
         self.clear()
         self.msg_dict["msg_type"] = MSG_NONCE_REQUEST
         self.msg_dict["variable_name"] = variable_name
-        self.msg_dict["nonce_number_list"] = nonce_list
+        self.msg_dict["nonce_range_list"] = nonce_ranges
         return self
 
-    def init_nonce_send(self, variable_name: str, nonce_dict: dict[int, int]):
+    def init_nonce_send(self, variable_name: str, nonce_dict: dict[int, int], chunk_index: int = 0, chunk_count: int = 1):
         self.clear()
         self.msg_dict["msg_type"] = MSG_NONCE_SEND
         self.msg_dict["variable_name"] = variable_name
         self.msg_dict["nonce_dict"] = nonce_dict
+        if chunk_count > 1:
+            self.msg_dict["chunk_index"] = chunk_index
+            self.msg_dict["chunk_count"] = chunk_count
         return self
 
-    def init_sync_data(self, variable_name: str, previous_value: int, history: dict[int, int]):
+    def init_sync_data(
+        self,
+        variable_name: str,
+        previous_value: int,
+        history: dict[int, int],
+        chunk_index: int = 0,
+        chunk_count: int = 1,
+        checkpoint_cuts: dict[str, int] = None,
+    ):
         self.clear()
         self.msg_dict["msg_type"] = MSG_SYNC_DATA
         self.msg_dict["variable_name"] = variable_name
         self.msg_dict["history"] = history
         self.msg_dict["previous_value"] = previous_value
+        if chunk_count > 1:
+            self.msg_dict["chunk_index"] = chunk_index
+            self.msg_dict["chunk_count"] = chunk_count
+        if checkpoint_cuts:
+            self.msg_dict["checkpoint_cuts"] = checkpoint_cuts
         return self
 
     def init_sync_mismatch_data(self, variable_max_nonce_dict):
@@ -106,11 +150,79 @@ class Msg:
         self.msg_dict["msg_type"] = MSG_SYNC_MISMATCH_REQUEST
         return self
 
+    def init_version_vector(self, version_vectors: dict[str, dict[str, int]]):
+        self.clear()
+        self.msg_dict["msg_type"] = MSG_VERSION_VECTOR
+        self.msg_dict["version_vectors"] = version_vectors
+        return self
+
+    def init_checkpoint_propose(self, checkpoint_id: int):
+        self.clear()
+        self.msg_dict["msg_type"] = MSG_CHECKPOINT_PROPOSE
+        self.msg_dict["checkpoint_id"] = checkpoint_id
+        return self
+
+    def init_checkpoint_vote(self, checkpoint_id: int, version_vectors: dict[str, dict[str, int]]):
+        self.clear()
+        self.msg_dict["msg_type"] = MSG_CHECKPOINT_VOTE
+        self.msg_dict["checkpoint_id"] = checkpoint_id
+        self.msg_dict["version_vectors"] = version_vectors
+        return self
+
+    def init_checkpoint_commit(self, checkpoint_id: int, checkpoint_cuts: dict[str, dict[str, int]]):
+        self.clear()
+        self.msg_dict["msg_type"] = MSG_CHECKPOINT_COMMIT
+        self.msg_dict["checkpoint_id"] = checkpoint_id
+        self.msg_dict["checkpoint_cuts"] = checkpoint_cuts
+        return self
+
+    def init_gossip(
+        self,
+        members: dict[str, list],
+        digests: dict[str, dict[str, list]] = None,
+        operations: dict[str, dict[str, list]] = None,
+        is_reply: bool = False,
+    ):
+        self.clear()
+        self.msg_dict["msg_type"] = MSG_GOSSIP
+        self.msg_dict["members"] = members
+        if digests is not None:
+            self.msg_dict["digests"] = digests
+        if operations:
+            self.msg_dict["operations"] = operations
+        if is_reply:
+            self.msg_dict["is_reply"] = True
+        return self
+
     def from_jsonstr(self, jsonstr: str):
         self.clear()
         self.msg_dict = json.loads(jsonstr)
         return self
 
+    def from_bytes(self, data: bytes):
+        # data may be a memoryview into a reused receive buffer, decoding copies out everything it keeps
+        if BinaryCodec.is_binary(data):
+            if data[2] == BinaryCodec.VARIABLE_UPDATE_CODE:
+                return VariableUpdateMsg(*BinaryCodec.decode_variable_update(data))
+            msg_type, sync_round, offset = BinaryCodec.peek_header(data)
+            if msg_type == MSG_VARIABLE_UPDATE_BATCH:
+                msg = VariableUpdateBatchMsg()
+                BinaryCodec.decode_body(data, offset, msg)
+                if sync_round is not None:
+                    msg.sync_round = sync_round
+                return msg
+            self.msg_dict = {"msg_type": msg_type}
+            BinaryCodec.decode_body(data, offset, self.msg_dict)
+            if sync_round is not None:
+                self.msg_dict["sync_round"] = sync_round
+            return self
+        return self.from_jsonstr(str(data, "utf-8"))
+
+    def to_bytes(self, wire_format: str) -> bytes:
+        if wire_format == WIRE_FORMAT_BINARY:
+            return BinaryCodec.encode(self.msg_dict)
+        return self.to_jsonstr().encode()
+
     def to_string(self):
         return self.msg_dict
 
@@ -120,3 +232,76 @@ class Msg:
     def convert_dict_to_dict(self, original_dict) -> dict[int, int]:
         new_dict = {int(key): value for key, value in original_dict.items()}
         return new_dict
+
+
+class TypedMsg(Msg):
+    # the hottest message types keep their fields in slots, so decoding one allocates no dict
+    __slots__ = ()
+    MSG_TYPE = ""
+    FIELDS: Tuple[str, ...] = ()
+
+    def __getitem__(self, key):
+        if key == "msg_type":
+            return self.MSG_TYPE
+        if key in self.FIELDS and hasattr(self, key):
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        if key == "msg_type":
+            return self.MSG_TYPE
+        return getattr(self, key, default) if key in self.FIELDS else default
+
+    def __setitem__(self, key, value):
+        # msg_type comes with the class, fields this version doesn't know are skipped
+        if key in self.FIELDS:
+            setattr(self, key, value)
+
+    def clear(self):
+        for field in self.FIELDS:
+            if hasattr(self, field):
+                delattr(self, field)
+
+    def to_string(self):
+        msg_dict = {"msg_type": self.MSG_TYPE}
+        for field in self.FIELDS:
+            if hasattr(self, field):
+                msg_dict[field] = getattr(self, field)
+        return msg_dict
+
+    def to_bytes(self, wire_format: str) -> bytes:
+        if wire_format == WIRE_FORMAT_BINARY:
+            return BinaryCodec.encode(self.to_string())
+        return self.to_jsonstr().encode()
+
+    def to_jsonstr(self) -> str:
+        return json.dumps(self.to_string())
+
+
+class VariableUpdateMsg(TypedMsg):
+    __slots__ = ("variable_name", "operation", "nonce", "sync_round")
+    MSG_TYPE = MSG_VARIABLE_UPDATE
+    FIELDS = __slots__
+
+    def __init__(self, variable_name: str, operation: int, nonce: int, sync_round: int = None):
+        self.variable_name = variable_name
+        self.operation = operation
+        self.nonce = nonce
+        if sync_round is not None:
+            self.sync_round = sync_round
+
+    def to_bytes(self, wire_format: str) -> bytes:
+        if wire_format == WIRE_FORMAT_BINARY:
+            return BinaryCodec.encode_variable_update(self.variable_name, self.operation, self.nonce, self.get("sync_round"))
+        return self.to_jsonstr().encode()
+
+
+class VariableUpdateBatchMsg(TypedMsg):
+    __slots__ = ("variable_name", "nonce_ranges", "sync_round")
+    MSG_TYPE = MSG_VARIABLE_UPDATE_BATCH
+    FIELDS = __slots__
+
+    def __init__(self, variable_name: str = None, nonce_ranges: list = None):
+        if variable_name is not None:
+            self.variable_name = variable_name
+            self.nonce_ranges = nonce_ranges
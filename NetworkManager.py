@@ -1,8 +1,9 @@
-from typing import Union, Dict, List
+from typing import Callable, Union, Dict, List, Optional, Tuple
 from constants import (
     MSG_HELLO,
     MSG_HELLO_RECEIVED,
     MSG_VARIABLE_UPDATE,
+    MSG_VARIABLE_UPDATE_BATCH,
     MSG_START_SYNC,
     MSG_STOP_SYNC,
     MSG_STATUS_REQUEST,
@@ -12,425 +13,694 @@ from constants import (
     MSG_SYNC_DATA,
     MSG_SYNC_MISMATCH_REQUEST,
     MSG_SYNC_MISMATCH_DATA,
-    LISTEN_BUFFER_SIZE,
+    MSG_VERSION_VECTOR,
+    MSG_CHECKPOINT_PROPOSE,
+    MSG_CHECKPOINT_VOTE,
+    MSG_CHECKPOINT_COMMIT,
+    MSG_GOSSIP,
+    HELLO_INTERVAL_MIN,
+    HELLO_INTERVAL_MAX,
+    FAILURE_CHECK_INTERVAL,
+    BATCH_WINDOW,
+    BATCH_MAX_OPERATIONS,
+    WIRE_FORMAT_JSON,
+    WIRE_FORMAT_BINARY,
+    BINARY_VERSION,
+    SYNC_CHUNK_SIZE,
+    HISTORY_STORE_DICT,
+    HISTORY_STORE_ARRAY,
+    ANTI_ENTROPY_INTERVAL,
+    STATUS_WORK,
+    STATUS_READY,
+    INBOUND_WORKER_COUNT,
+    INBOUND_QUEUE_SIZE,
+    DROP_POLICY_DROP_LOWEST,
+    GOSSIP_INTERVAL,
+    WAL_RECORD_CREATE,
+    WAL_RECORD_ROUND,
+    WAL_RECORD_PEER,
 )
 
-import socket
-from threading import Thread, Timer
-import select
+from collections import deque
+from threading import Thread, Lock, Event
 import random
 import time
 from CRDT import CRDT
+from OpLog import OpLog
 from Msg import Msg
+from UpdateBatcher import UpdateBatcher
+from SyncCoordinator import SyncCoordinator
+from Checkpointer import Checkpointer
+from Gossiper import Gossiper
+from VariableRegistry import VariableRegistry
+from GapIndex import split_nonce_ranges
+from InboundQueue import InboundQueue, PRIORITY_NAMES
+from OutboundTracker import OutboundTracker
+from FailureDetector import FailureDetector
+from Metrics import Metrics
+from RetryPolicy import CIRCUIT_OPEN
+from Transport import Transport, TcpUdpTransport
+from WriteAheadLog import WriteAheadLog
+
+COORDINATOR_MSG_TYPES = {
+    MSG_HELLO,
+    MSG_HELLO_RECEIVED,
+    MSG_START_SYNC,
+    MSG_STOP_SYNC,
+    MSG_STATUS,
+    MSG_NONCE_SEND,
+    MSG_SYNC_DATA,
+    MSG_SYNC_MISMATCH_DATA,
+    MSG_GOSSIP,
+}
+MessageHandler = Callable[[Msg, str], None]
+# called with the message type and the seconds its handlers took
+HandlerHook = Callable[[str, float], None]
+HEARTBEAT_MSG_TYPES = {MSG_HELLO, MSG_HELLO_RECEIVED, MSG_STATUS, MSG_GOSSIP}
+# messages that belong to one full-sync round; they carry the sender's round so they are never applied in another one
+ROUND_SCOPED_MSG_TYPES = {
+    MSG_HELLO,
+    MSG_HELLO_RECEIVED,
+    MSG_VARIABLE_UPDATE,
+    MSG_VARIABLE_UPDATE_BATCH,
+    MSG_SYNC_DATA,
+    MSG_NONCE_SEND,
+    MSG_START_SYNC,
+    MSG_STOP_SYNC,
+    MSG_SYNC_MISMATCH_DATA,
+    MSG_CHECKPOINT_COMMIT,
+    MSG_GOSSIP,
+}
+# handled while ready: the agreement itself and the gossip that carries peers' statuses
+READY_MSG_TYPES = {MSG_STOP_SYNC, MSG_GOSSIP}
 
 
 class NetworkManager:
-    def __init__(self, port):
+    def __init__(
+        self,
+        port,
+        batch_window: float = BATCH_WINDOW,
+        batch_max_operations: int = BATCH_MAX_OPERATIONS,
+        wire_format: str = WIRE_FORMAT_BINARY,
+        history_store: str = HISTORY_STORE_DICT,
+        debug_verify: bool = False,
+        inbound_workers: int = INBOUND_WORKER_COUNT,
+        inbound_queue_size: int = INBOUND_QUEUE_SIZE,
+        inbound_drop_policy: str = DROP_POLICY_DROP_LOWEST,
+        metrics_enabled: bool = True,
+        data_dir: str = None,
+        gossip_fanout: int = 0,
+        gossip_interval: float = GOSSIP_INTERVAL,
+        seeds: List[str] = None,
+        ip: str = None,
+        transport: Transport = None,
+    ):
         self.peers = {}
-        self.ip = self.get_myip()
         self.port = port
+        self.transport = transport or TcpUdpTransport(port, ip)
+        self.ip = ip or self.transport.address
         self.current_status = "work"
-        self.variable_name_to_object: Dict[str, CRDT] = {}
+        self.wal: Optional[WriteAheadLog] = None
+        self.recovered = False
+        self.variable_name_to_object = VariableRegistry(self._new_crdt)
         self.peers_variables_max_nonces: Dict[str, Dict[str, int]] = {}
         self.peers_sync_values: Dict[str, Dict[str, int]] = {}
+        # binary is advertised with its version, peers on another version fall back to JSON
+        binary_wire_format = f"{WIRE_FORMAT_BINARY}/{BINARY_VERSION}"
+        self.wire_formats = [binary_wire_format, WIRE_FORMAT_JSON] if wire_format == WIRE_FORMAT_BINARY else [WIRE_FORMAT_JSON]
+        self.peer_wire_formats: Dict[str, str] = {}
+        self.history_factory = OpLog if history_store == HISTORY_STORE_ARRAY else dict
+        self.debug_verify = debug_verify
+        self.sync_coordinator = SyncCoordinator(self)
+        self.checkpointer = Checkpointer(self)
+        self.gossiper = Gossiper(self, gossip_fanout, gossip_interval, seeds)
+        self.outbound_tracker = OutboundTracker()
+        self.failure_detector = FailureDetector()
+        self.metrics = Metrics(metrics_enabled)
+        self.metrics.add_collector(self._collect_metrics)
+        self.handlers: Dict[str, List[MessageHandler]] = {}
+        self.handler_hooks: List[HandlerHook] = []
+        self._register_default_handlers()
+        if metrics_enabled:
+            self.add_handler_hook(self._observe_handler)
+        self.membership_changed = Event()
+        self.incarnation = time.time_ns() // 1000000
+        self.peer_incarnations: Dict[str, int] = {}
+        self.sync_round = 0
+        self.round_lock = Lock()
+        self.deferred_msgs = deque(maxlen=inbound_queue_size)
+        self.inbound_queue = InboundQueue(self._dispatch, inbound_workers, inbound_queue_size, inbound_drop_policy)
+        self.update_batcher = None
+        if batch_window > 0 and batch_max_operations > 1:
+            self.update_batcher = UpdateBatcher(self._broadcast_update_batch, batch_window, batch_max_operations)
+        if data_dir is not None:
+            self.wal = WriteAheadLog(data_dir)
+            self._recover()
 
     def get_peers(self):
         return self.peers
 
-    def get_variable_name_to_object(self) -> Dict[str, CRDT]:
+    def get_variable_name_to_object(self) -> VariableRegistry:
         return self.variable_name_to_object
 
-    def get_myip(self) -> str:
-        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        s.settimeout(0)
-        try:
-            s.connect(("10.254.254.254", 1))
-            ip = s.getsockname()[0]
-        except Exception as e:
-            print("ERROR in get_myip: ", e)
-            ip = "127.0.0.1"
-        finally:
-            s.close()
-        return ip
+    def _new_crdt(self, variable_name: str) -> CRDT:
+        crdt = CRDT(variable_name, self.history_factory, self.debug_verify, self.ip)
+        if self.wal is not None and self.wal.fd is not None:
+            crdt.journal = self.wal.append
+        return crdt
+
+    def _recover(self) -> None:
+        # the last snapshot plus the log after it; the node keeps its incarnation, so peers keep its operations
+        started = time.perf_counter()
+        snapshot = self.wal.load_snapshot()
+        if snapshot is not None and snapshot["ip"] != self.ip:
+            print(f"data directory belongs to {snapshot['ip']}, starting without it")
+            snapshot = None
+
+        replayed = 0
+        if snapshot is not None:
+            self.incarnation = snapshot["incarnation"]
+            self.sync_round = snapshot["sync_round"]
+            self.peer_incarnations = dict(snapshot["peer_incarnations"])
+            for variable_name, state in snapshot["variables"].items():
+                self.variable_name_to_object.get_or_create(variable_name).load_state(state)
+            for lsn, record_type, variable_name, args in self.wal.read_log():
+                self._replay(lsn, record_type, variable_name, args)
+                replayed += 1
+            self.recovered = True
+
+        for variable_name, crdt in self.variable_name_to_object.items():
+            crdt.journal = self.wal.append
+        self.wal.open()
+        self.wal.snapshot(self._snapshot_state)
+        self.wal.start(self._snapshot_state)
+        if snapshot is not None:
+            elapsed = (time.perf_counter() - started) * 1000
+            print(f"recovered {len(self.variable_name_to_object)} variables and {replayed} log records in {elapsed:.1f}ms")
+
+    def _replay(self, lsn: int, record_type: int, variable_name: str, args: list) -> None:
+        if record_type == WAL_RECORD_ROUND:
+            self.sync_round = max(self.sync_round, args[0])
+        elif record_type == WAL_RECORD_PEER:
+            self.peer_incarnations[args[0]] = args[1]
+        elif record_type == WAL_RECORD_CREATE:
+            crdt = self.variable_name_to_object.get(variable_name)
+            if crdt is None or lsn > crdt.last_lsn:
+                self.variable_name_to_object.create(variable_name).last_lsn = lsn
+        else:
+            # records up to the variable's lsn are already part of the snapshot
+            crdt = self.variable_name_to_object.get_or_create(variable_name)
+            if lsn > crdt.last_lsn:
+                crdt.replay(record_type, args)
+                crdt.last_lsn = lsn
+
+    def _snapshot_state(self) -> dict:
+        return {
+            "ip": self.ip,
+            "incarnation": self.incarnation,
+            "sync_round": self.sync_round,
+            "peer_incarnations": dict(self.peer_incarnations),
+            "variables": {variable_name: crdt.get_state() for variable_name, crdt in self.variable_name_to_object.items()},
+        }
+
+    def _discard_recovered_state(self) -> None:
+        # the cluster folded this node's operations into a full-sync it missed, replaying them would count them twice
+        print("missed a full-sync while down, starting over as a new incarnation")
+        self.variable_name_to_object.clear()
+        self.incarnation = time.time_ns() // 1000000
+        if self.wal is not None:
+            self.wal.snapshot(self._snapshot_state)
+        # an empty version vector makes every peer send its before_sync_value right away
+        self.broadcast_threaded(self._version_vector_msg())
+        self.membership_changed.set()
+
+    def periodic_hello_broadcast(self, min_interval: float = HELLO_INTERVAL_MIN, max_interval: float = HELLO_INTERVAL_MAX):
+        # fast while peers come and go, backing off to max_interval once membership is stable
+        interval = min_interval
+        while True:
+            self.broadcast_threaded(Msg().init_hello(self.ip, self.current_status, self.wire_formats, self.incarnation))
+            if self.membership_changed.wait(interval):
+                self.membership_changed.clear()
+                interval = min_interval
+            else:
+                interval = min(max_interval, interval * 2)
 
-    def periodic_hello_broadcast(self, sleep_duration):
+    def detect_failures(self, check_interval: float = FAILURE_CHECK_INTERVAL) -> None:
         while True:
-            self.broadcast_threaded(Msg().init_hello(self.ip, self.current_status))
-            time.sleep(sleep_duration)
+            time.sleep(check_interval)
+            for ip in self.failure_detector.get_suspects(list(self.peers)):
+                self._evict_peer(ip)
+
+    def _evict_peer(self, ip: str) -> None:
+        # a dead peer must not hold a sync round open; if it comes back it goes through the handshake again
+        self.peers.pop(ip, None)
+        self.peer_wire_formats.pop(ip, None)
+        self.peers_variables_max_nonces.pop(ip, None)
+        self.peers_sync_values.pop(ip, None)
+        self.failure_detector.remove(ip)
+        self.outbound_tracker.complete_prefix((ip,))
+        self.transport.close_peer(ip)
+        print(f"peer {ip} evicted")
+        self.membership_changed.set()
+        self.sync_coordinator.notify()
+
+    def _collect_metrics(self) -> List[Tuple[str, str, float]]:
+        inbound_stats = self.inbound_queue.get_stats()
+        outbound_stats = self.outbound_tracker.get_stats()
+        peer_health = self.transport.get_health().values()
+        samples = [
+            ("send_failures_total", "", self.transport.get_send_failures()),
+            ("outbound_retries_total", "", outbound_stats["retried"]),
+            ("outbound_suppressed_total", "", outbound_stats["suppressed"]),
+            ("circuits_open", "", sum(health.get("circuit") == CIRCUIT_OPEN for health in peer_health)),
+            ("handler_errors_total", "", inbound_stats["errors"]),
+            ("peers", "", len(self.peers)),
+            ("sync_round", "", self.sync_round),
+        ]
+        for priority_name, depth in zip(PRIORITY_NAMES, inbound_stats["depths"]):
+            samples.append(("inbound_queue_depth", priority_name, depth))
+        for msg_type, count in inbound_stats["dropped"].items():
+            samples.append(("inbound_dropped_total", msg_type, count))
+        for peer, count in self.transport.dead_letters.get_counts().items():
+            samples.append(("dead_letters_total", peer, count))
+        for variable_name, crdt in self.variable_name_to_object.items():
+            samples.append(("history_size", variable_name, crdt.get_history_size()))
+        return samples
+
+    def _check_incarnation(self, ip: str, incarnation: int) -> None:
+        # a peer that restarted lost its history, so it is treated as a new node that has to shake hands again
+        if incarnation is None:
+            return
+        known_incarnation = self.peer_incarnations.get(ip)
+        if known_incarnation != incarnation and self.wal is not None:
+            self.wal.append(WAL_RECORD_PEER, "", [ip, incarnation])
+        self.peer_incarnations[ip] = incarnation
+        if known_incarnation is not None and known_incarnation != incarnation:
+            self.peers.pop(ip, None)
+            for variable_name, crdt in self.variable_name_to_object.items():
+                crdt.retire_node(ip)
 
     def _sync_broadcast(self) -> None:
+        if self.gossiper.enabled:
+            # every gossip round already exchanges digests with a few peers
+            return
         while True:
-            for variable_name in self.variable_name_to_object:
-                crdt = self.variable_name_to_object[variable_name]
-                msg = Msg().init_sync_data(variable_name, crdt.before_sync_value, crdt.self_history)
-                thread = Thread(target=self._broadcast, args=(msg,))
-                thread.start()
-            time.sleep(100)
+            self.broadcast_threaded(self._version_vector_msg())
+            time.sleep(ANTI_ENTROPY_INTERVAL)
+
+    def _version_vector_msg(self) -> Msg:
+        version_vectors: Dict[str, Dict[str, int]] = {}
+        for variable_name, crdt in self.variable_name_to_object.items():
+            version_vectors[variable_name] = crdt.get_version_vector(self.ip)
+        return Msg().init_version_vector(version_vectors)
+
+    def _variable_max_nonces(self) -> Dict[str, int]:
+        # taking each variable lock waits out local operations that passed the work check before the status changed
+        variable_max_nonce_dict: Dict[str, int] = {}
+        for variable_name, crdt in self.variable_name_to_object.items():
+            with crdt.lock:
+                variable_max_nonce_dict[variable_name] = crdt.current_nonce
+        return variable_max_nonce_dict
+
+    def _send_missing_deltas(self, version_vectors: Dict[str, Dict[str, int]], ip: str) -> None:
+        for variable_name, crdt in self.variable_name_to_object.items():
+            # a peer that has never seen the variable still needs its before_sync_value, even without new operations
+            known_nonce = version_vectors.get(variable_name, {}).get(self.ip, 0)
+            if variable_name not in version_vectors or known_nonce < crdt.current_nonce:
+                for msg in self._sync_data_messages(variable_name, crdt, known_nonce):
+                    self.send_threaded(msg, ip)
+
+    def _sync_data_messages(self, variable_name: str, crdt: CRDT, start_nonce: int = 0) -> List[Msg]:
+        history, checkpoint_cuts, before_sync_value = crdt.get_self_history_since(start_nonce)
+        chunk_count = max(1, (len(history) + SYNC_CHUNK_SIZE - 1) // SYNC_CHUNK_SIZE)
+        messages = []
+        for chunk_index in range(chunk_count):
+            chunk = dict(history[chunk_index * SYNC_CHUNK_SIZE : (chunk_index + 1) * SYNC_CHUNK_SIZE])
+            messages.append(
+                Msg().init_sync_data(
+                    variable_name,
+                    before_sync_value,
+                    chunk,
+                    chunk_index,
+                    chunk_count,
+                    checkpoint_cuts,
+                )
+            )
+        return messages
 
     def schedule_sync_broadcast(self) -> None:
         Thread(target=self._sync_broadcast).start()
 
     def send_threaded(self, msg: Msg, ip: str):
-        thread = Thread(target=self._send, args=(msg, ip))
-        thread.start()
+        self._make_durable()
+        payload = self._encode_for_peer(msg, ip)
+        self._count_sent(msg, payload)
+        self.transport.send(ip, payload)
 
     def broadcast_threaded(self, msg: Msg):
-        thread = Thread(target=self._broadcast, args=(msg,))
-        thread.start()
-
-    def listen_tcp_threaded(self):
-        thread = Thread(
-            target=self._listen_tcp,
-        )
-        thread.start()
-
-    def listen_udp_threaded(self):
-        thread = Thread(
-            target=self._listen_udp,
-        )
+        self._make_durable()
+        payload = self._encode_for_broadcast(msg)
+        self._count_sent(msg, payload)
+        self.transport.broadcast(payload)
+
+    def _make_durable(self) -> None:
+        # nothing leaves the node before the log that produced it is on disk, so a restart never reuses a nonce peers saw
+        if self.wal is not None:
+            self.wal.sync()
+
+    def _count_sent(self, msg: Msg, payload: bytes) -> None:
+        if self.metrics.enabled:
+            self.metrics.inc("messages_sent_total", msg["msg_type"])
+            self.metrics.inc("bytes_sent_total", msg["msg_type"], len(payload))
+
+    def publish_update(self, variable_name: str, operation_value: int, nonce: int):
+        if self.update_batcher is None:
+            self._publish(Msg().init_variable_update(variable_name, operation_value, nonce))
+        else:
+            self.update_batcher.add(variable_name, nonce, operation_value)
+
+    def flush_updates(self):
+        if self.update_batcher is not None:
+            self.update_batcher.flush()
+
+    def _broadcast_update_batch(self, variable_name: str, nonce_ranges: list):
+        if len(nonce_ranges) == 1 and len(nonce_ranges[0][1]) == 1:
+            nonce, operation_values = nonce_ranges[0]
+            self._publish(Msg().init_variable_update(variable_name, operation_values[0], nonce))
+        else:
+            self._publish(Msg().init_variable_update_batch(variable_name, nonce_ranges))
+
+    def _publish(self, msg: Msg) -> None:
+        if self.gossiper.enabled:
+            self.gossiper.push(msg)
+        else:
+            self.broadcast_threaded(msg)
+
+    def handle_user_input_threaded(self, operation_value: str, variable_name: str):
+        thread = Thread(target=self.handle_user_input, args=(operation_value, variable_name))
         thread.start()
 
-    def _send(self, msg: Msg, ip: str):
-        jsonstr_msg = msg.to_jsonstr()
+    def listen_threaded(self):
+        self.transport.start(self._handle_received)
+
+    def _negotiate_wire_format(self, ip: str, peer_wire_formats: List[str]):
+        for wire_format in self.wire_formats:
+            if wire_format in peer_wire_formats:
+                self.peer_wire_formats[ip] = wire_format.split("/")[0]
+                return
+        self.peer_wire_formats[ip] = WIRE_FORMAT_JSON
+
+    def _stamp_sync_round(self, msg: Msg) -> Msg:
+        if msg["msg_type"] in ROUND_SCOPED_MSG_TYPES:
+            msg["sync_round"] = self.sync_round
+        return msg
+
+    def _encode_for_peer(self, msg: Msg, ip: str) -> bytes:
+        self._stamp_sync_round(msg)
+        # handshake messages stay JSON so nodes that don't know our formats can still read them
+        if msg["msg_type"] == MSG_HELLO or msg["msg_type"] == MSG_HELLO_RECEIVED:
+            return msg.to_bytes(WIRE_FORMAT_JSON)
+        return msg.to_bytes(self.peer_wire_formats.get(ip, WIRE_FORMAT_JSON))
+
+    def _encode_for_broadcast(self, msg: Msg) -> bytes:
+        self._stamp_sync_round(msg)
+        if msg["msg_type"] == MSG_HELLO or len(self.peers) == 0:
+            return msg.to_bytes(WIRE_FORMAT_JSON)
+        for ip in list(self.peers):
+            if self.peer_wire_formats.get(ip) != WIRE_FORMAT_BINARY:
+                return msg.to_bytes(WIRE_FORMAT_JSON)
+        return msg.to_bytes(WIRE_FORMAT_BINARY)
+
+    def _handle_received(self, data: bytes, ip: str):
+        if self.ip == ip:
+            return
+
+        msg_type, sync_round = Msg.peek_header(data)
+        msg = None
+        if msg_type is None:
+            msg = Msg().from_bytes(data)
+            msg_type, sync_round = msg["msg_type"], msg.get("sync_round")
+        if self.metrics.enabled:
+            self.metrics.inc("messages_received_total", msg_type)
+            self.metrics.inc("bytes_received_total", msg_type, len(data))
+        if msg_type in HEARTBEAT_MSG_TYPES:
+            self.failure_detector.heartbeat(ip)
+        if sync_round is not None and sync_round < self.sync_round:
+            # rounds only move forward, so a finished round's message is dropped before its body is decoded
+            return
+        if msg is None:
+            msg = Msg().from_bytes(data)
+        self.inbound_queue.put(msg, ip, self.transport.can_block())
+
+    def _register_default_handlers(self) -> None:
+        self.register_handler(MSG_HELLO, self._handle_hello)
+        self.register_handler(MSG_HELLO_RECEIVED, self._handle_hello_received)
+        self.register_handler(MSG_VARIABLE_UPDATE, self._handle_crdt_msg)
+        self.register_handler(MSG_VARIABLE_UPDATE_BATCH, self._handle_crdt_msg)
+        self.register_handler(MSG_SYNC_DATA, self._handle_crdt_msg)
+        self.register_handler(MSG_VERSION_VECTOR, self._handle_version_vector)
+        self.register_handler(MSG_CHECKPOINT_PROPOSE, self._handle_checkpoint_propose)
+        self.register_handler(MSG_CHECKPOINT_VOTE, self._handle_checkpoint_vote)
+        self.register_handler(MSG_CHECKPOINT_COMMIT, self._handle_checkpoint_commit)
+        self.register_handler(MSG_START_SYNC, self._handle_start_sync)
+        self.register_handler(MSG_STOP_SYNC, self._handle_stop_sync)
+        self.register_handler(MSG_SYNC_MISMATCH_REQUEST, self._handle_sync_mismatch_request)
+        self.register_handler(MSG_SYNC_MISMATCH_DATA, self._handle_sync_mismatch_data)
+        self.register_handler(MSG_NONCE_REQUEST, self._handle_nonce_request)
+        self.register_handler(MSG_NONCE_SEND, self._handle_nonce_send)
+        self.register_handler(MSG_STATUS, self._handle_status)
+        self.register_handler(MSG_STATUS_REQUEST, self._handle_status_request)
+        self.register_handler(MSG_GOSSIP, self._handle_gossip)
+
+    def register_handler(self, msg_type: str, handler: MessageHandler) -> None:
+        # handlers of one type run in registration order, after the sync round check admitted the message
+        self.handlers.setdefault(msg_type, []).append(handler)
+
+    def add_handler_hook(self, hook: HandlerHook) -> None:
+        self.handler_hooks.append(hook)
+
+    def _observe_handler(self, msg_type: str, seconds: float) -> None:
+        self.metrics.observe("handler_seconds", seconds, msg_type)
+
+    def _dispatch(self, msg: Msg, ip: str):
+        if len(self.handler_hooks) == 0:
+            return self._handle_msg(msg, ip)
+
+        started = time.perf_counter()
         try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.connect((ip, self.port))
-                s.sendall(jsonstr_msg.encode())
-                s.close()
-        except Exception as e:
-            print(end="")
-            self._send(msg, ip)
+            self._handle_msg(msg, ip)
+        finally:
+            elapsed = time.perf_counter() - started
+            for hook in self.handler_hooks:
+                hook(msg["msg_type"], elapsed)
 
-    def _broadcast(self, msg: Msg):
-        jsonstr_msg = msg.to_jsonstr()
-        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        try:
-            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            s.bind(("", 0))
-            s.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-            s.sendto(jsonstr_msg.encode(), ("<broadcast>", self.port))
-            s.close()
-        except Exception as e:
-            s.close()
-            print(end="")
+    def _handle_msg(self, msg: Msg, ip: str):
+        if not self._admit_sync_round(msg, ip):
+            return
 
-    def _listen_tcp(self):
-        while True:
-            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            try:
-                s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-                s.bind(("", self.port))
-                s.listen()
-                conn, addr = s.accept()
-                with conn:
-                    while True:
-                        data = conn.recv(LISTEN_BUFFER_SIZE)
-                        if not data:
-                            break
-                        jsonstr_msg = data.decode()
-                        msg = Msg().from_jsonstr(jsonstr_msg)
-
-                        if self.ip == addr[0]:
-                            conn.close()
-                            s.close()
-                            continue
-
-                        self._network_handler(msg, addr[0])
-
-                        self._crdt_handler(msg, addr[0])
-
-                    conn.close()
-                s.close()
-            except Exception as e:
-                s.close()
-                print(end="")
-
-    def _listen_udp(self):
-        while True:
-            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            try:
-                s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-                s.bind(("", self.port))
-                s.setblocking(False)
-                result = select.select([s], [], [])
-                jsonstr_msg, ip = result[0][0].recvfrom(LISTEN_BUFFER_SIZE)
-                msg = Msg().from_jsonstr(jsonstr_msg.decode())
-
-                if self.ip == ip[0]:
-                    s.close()
-                    continue
-
-                self._network_handler(msg, ip[0])
-
-                self._crdt_handler(msg, ip[0])
-
-                s.close()
-            except Exception as e:
-                s.close()
-                print(end="")
-
-    def _network_handler(self, msg: Msg, ip: str):
-        msg_type = msg.__getitem__("msg_type")
-        if msg_type == MSG_HELLO:
-            try:
-                status = msg.__getitem__("status")
-                ip_from_message = msg.__getitem__("ip")
-                if ip not in self.peers:
-                    for variable in self.variable_name_to_object:
-                        crdt = self.variable_name_to_object[variable]
-                        self.peers[ip_from_message] = status
-                        self.send_threaded(
-                            Msg().init_sync_data(
-                                variable,
-                                crdt.get_before_sync_value(),
-                                crdt.get_self_history(),
-                            ),
-                            ip,
-                        )
-                    self.send_threaded(Msg().init_hello_received(self.current_status), ip)
-
-                    if status == "work" and (self.current_status == "ready" or self.current_status == "sync"):
-                        variable_max_nonce_dict: Dict[str, int] = {}
-                        for variable_name in self.variable_name_to_object:
-                            crdt = self.variable_name_to_object[variable_name]
-                            variable_max_nonce_dict[variable_name] = crdt.current_nonce
-
-                        start_sync_msg = Msg().init_start_sync(variable_max_nonce_dict)
-                        self.send_threaded(start_sync_msg, ip_from_message)
-
-            except Exception as e:
-                print(end="")
-
-        if msg_type == MSG_HELLO_RECEIVED:
-            try:
-                status = msg.__getitem__("status")
-                self.peers[ip] = status
-            except Exception as e:
-                print(end="")
-
-        if msg_type == MSG_STOP_SYNC:
-            try:
-                variable_value_dict = msg.__getitem__("variable_value_dict")
-                self.peers_sync_values[ip] = variable_value_dict
-            except Exception as e:
-                print(end="")
-
-        if msg_type == MSG_START_SYNC:
-            try:
+        msg_type = msg["msg_type"]
+        try:
+            # a handler that raises is counted as an error by the inbound queue
+            for handler in self.handlers.get(msg_type, ()):
+                handler(msg, ip)
+        finally:
+            if msg_type in COORDINATOR_MSG_TYPES:
+                self.sync_coordinator.notify()
+
+    def _admit_sync_round(self, msg: Msg, ip: str) -> bool:
+        sync_round = msg.get("sync_round")
+        if sync_round is None:
+            return True
+
+        with self.round_lock:
+            if sync_round < self.sync_round:
+                # everything of a finished round is already folded into before_sync_value
+                return False
+            if sync_round > self.sync_round and self.current_status == STATUS_WORK:
+                # we joined after the sender's last full-sync
+                self._set_sync_round(sync_round)
+                if self.recovered:
+                    self._discard_recovered_state()
+            elif sync_round > self.sync_round or (self.current_status == STATUS_READY and msg["msg_type"] not in READY_MSG_TYPES):
+                # while ready only the agreement is pending, data waits until the round is reset or reopened
+                self.deferred_msgs.append((msg, ip))
+                return False
+            self.recovered = False
+        return True
+
+    def _set_sync_round(self, sync_round: int) -> None:
+        if self.wal is not None:
+            self.wal.append(WAL_RECORD_ROUND, "", [sync_round])
+        self.sync_round = sync_round
+
+    def _finish_sync_round(self) -> None:
+        with self.round_lock:
+            for variable_name, crdt in self.variable_name_to_object.items():
+                crdt.reset()
+            self._set_sync_round(self.sync_round + 1)
+        self.outbound_tracker.clear()
+        if self.wal is not None:
+            # histories are empty right after a reset, the cheapest moment to compact the log
+            self.wal.sync()
+            self.wal.request_snapshot()
+
+    def _release_deferred_msgs(self) -> None:
+        with self.round_lock:
+            deferred_msgs = list(self.deferred_msgs)
+            self.deferred_msgs.clear()
+        for msg, ip in deferred_msgs:
+            self.inbound_queue.put(msg, ip, self.transport.can_block())
+
+    def _handle_hello(self, msg: Msg, ip: str):
+        status = msg.__getitem__("status")
+        ip_from_message = msg.__getitem__("ip")
+        self._negotiate_wire_format(ip, msg.get("wire_formats", [WIRE_FORMAT_JSON]))
+        self._check_incarnation(ip, msg.get("incarnation"))
+        if ip not in self.peers:
+            self.peers[ip_from_message] = status
+            self.membership_changed.set()
+            self.send_threaded(self._version_vector_msg(), ip)
+            self.send_threaded(Msg().init_hello_received(self.current_status, self.wire_formats, self.incarnation), ip)
+
+            if status == "work" and (self.current_status == "ready" or self.current_status == "sync"):
+                start_sync_msg = Msg().init_start_sync(self._variable_max_nonces())
+                self.send_threaded(start_sync_msg, ip_from_message)
+
+    def _handle_hello_received(self, msg: Msg, ip: str):
+        status = msg.__getitem__("status")
+        self._negotiate_wire_format(ip, msg.get("wire_formats", [WIRE_FORMAT_JSON]))
+        self._check_incarnation(ip, msg.get("incarnation"))
+        if ip not in self.peers:
+            self.membership_changed.set()
+        self.peers[ip] = status
+
+    def _handle_version_vector(self, msg: Msg, ip: str):
+        self._send_missing_deltas(msg.__getitem__("version_vectors"), ip)
+
+    def _handle_checkpoint_propose(self, msg: Msg, ip: str):
+        self.checkpointer.handle_propose(msg.__getitem__("checkpoint_id"), ip)
+
+    def _handle_checkpoint_vote(self, msg: Msg, ip: str):
+        self.checkpointer.handle_vote(msg.__getitem__("checkpoint_id"), msg.__getitem__("version_vectors"), ip)
+
+    def _handle_checkpoint_commit(self, msg: Msg, ip: str):
+        self.checkpointer.apply_commit(msg.__getitem__("checkpoint_id"), msg.__getitem__("checkpoint_cuts"))
+
+    def _handle_stop_sync(self, msg: Msg, ip: str):
+        variable_value_dict = msg.__getitem__("variable_value_dict")
+        self.peers_sync_values[ip] = variable_value_dict
+
+    def _handle_start_sync(self, msg: Msg, ip: str):
+        # only the node leaving work announces itself, otherwise start_sync messages bounce between peers forever
+        if self.current_status == "work":
+            self.current_status = "sync"
+            self.peers_variables_max_nonces = {}
+            start_sync_msg = Msg().init_start_sync(self._variable_max_nonces())
+            self.flush_updates()
+            for node_ip in self.peers:
+                self.send_threaded(start_sync_msg, node_ip)
+
+        variable_max_nonce_dict = msg.__getitem__("variable_max_nonce_dict")
+        self.peers_variables_max_nonces[ip] = variable_max_nonce_dict
+        self.outbound_tracker.complete((ip, MSG_SYNC_MISMATCH_REQUEST))
+        for variable_name in variable_max_nonce_dict:
+            self.variable_name_to_object.get_or_create(variable_name)
+            if self._request_missing_nonces(variable_name, ip, variable_max_nonce_dict[variable_name]):
                 self.current_status = "sync"
-                time.sleep(0.1)
 
-                variable_max_nonce_dict: Dict[str, int] = {}
-                for variable_name in self.variable_name_to_object:
-                    crdt = self.variable_name_to_object[variable_name]
-                    variable_max_nonce_dict[variable_name] = crdt.current_nonce
+    def _handle_sync_mismatch_request(self, msg: Msg, ip: str):
+        self.send_threaded(Msg().init_sync_mismatch_data(self._variable_max_nonces()), ip)
+
+    def _handle_sync_mismatch_data(self, msg: Msg, ip: str):
+        if self.current_status == STATUS_WORK:
+            # a late answer to the previous round must not count towards the next one
+            return
+        variable_max_nonce_dict = msg.__getitem__("variable_max_nonce_dict")
+        self.peers_variables_max_nonces[ip] = variable_max_nonce_dict
+        self.outbound_tracker.complete((ip, MSG_SYNC_MISMATCH_REQUEST))
+        for variable_name in variable_max_nonce_dict:
+            self.variable_name_to_object.get_or_create(variable_name)
+            self._request_missing_nonces(variable_name, ip, variable_max_nonce_dict[variable_name])
+
+    def _handle_nonce_request(self, msg: Msg, ip: str):
+        variable_name = msg.__getitem__("variable_name")
+        crdt = self.variable_name_to_object[variable_name]
+        nonce_ranges = msg.get("nonce_range_list")
+        if nonce_ranges is None:
+            nonce_ranges = [[nonce, nonce + 1] for nonce in msg.__getitem__("nonce_number_list")]
+
+        # streamed in chunks read straight from the history, so a large catch-up never builds one huge message;
+        # an empty answer still goes out so the requester can ask again
+        chunks = split_nonce_ranges(crdt.clamp_nonce_ranges(nonce_ranges), SYNC_CHUNK_SIZE) or [[]]
+        for chunk_index, chunk_ranges in enumerate(chunks):
+            nonce_dict = crdt.get_nonce_values(chunk_ranges)
+            self.send_threaded(Msg().init_nonce_send(variable_name, nonce_dict, chunk_index, len(chunks)), ip)
+
+    def _handle_nonce_send(self, msg: Msg, ip: str):
+        variable_name = msg.__getitem__("variable_name")
+        nonce_dict = msg.convert_dict_to_dict(msg.__getitem__("nonce_dict"))
+        crdt = self.variable_name_to_object[variable_name]
+        crdt.merge_sync_history(ip, nonce_dict)
+        crdt.sync_with_history()
+        if msg.get("chunk_index", 0) == msg.get("chunk_count", 1) - 1:
+            # whatever is still missing may be asked for again right away
+            self.outbound_tracker.complete((ip, MSG_NONCE_REQUEST, variable_name))
+
+    def _handle_status(self, msg: Msg, ip: str):
+        # an evicted peer only becomes a peer again through the handshake
+        if ip in self.peers:
+            self.peers[ip] = msg["status"]
+
+    def _handle_status_request(self, msg: Msg, ip: str):
+        self.send_threaded(Msg().init_status(self.current_status), ip)
+
+    def _handle_gossip(self, msg: Msg, ip: str):
+        self.gossiper.handle_gossip(msg, ip)
 
-                start_sync_msg = Msg().init_start_sync(variable_max_nonce_dict)
-                for node_ip in self.peers:
-                    self.send_threaded(start_sync_msg, node_ip)
-
-                variable_max_nonce_dict = msg.__getitem__("variable_max_nonce_dict")
-                for variable_name in variable_max_nonce_dict:
-                    if variable_name not in self.variable_name_to_object:
-                        self.variable_name_to_object[variable_name] = CRDT(variable_name)
-
-                    max_nonce = variable_max_nonce_dict[variable_name]
-                    missing_nonce_list: List[int] = []
-                    for nonce_number in range(max_nonce):
-                        if nonce_number not in self.variable_name_to_object[variable_name].sync_history:
-                            missing_nonce_list.append(nonce_number)
-
-                    self.peers_variables_max_nonces[ip] = variable_max_nonce_dict
+    def check_everything_is_ready(self) -> None:
+        self.sync_coordinator.run()
 
-                    msg = Msg().init_nonce_request(variable_name, missing_nonce_list)
-                    self.send_threaded(msg, ip)
-            except Exception as e:
-                print(end="")
+    def _request_missing_nonces(self, variable_name: str, node_id: str, max_nonce: int) -> bool:
+        crdt = self.variable_name_to_object[variable_name]
+        missing_nonce_ranges = crdt.get_missing_nonce_ranges(node_id, max_nonce)
+        if len(missing_nonce_ranges) == 0:
+            return False
 
-        if msg_type == MSG_SYNC_MISMATCH_REQUEST:
-            variable_max_nonce_dict: Dict[str, int] = {}
-            for variable_name in self.variable_name_to_object:
-                crdt = self.variable_name_to_object[variable_name]
-                variable_max_nonce_dict[variable_name] = crdt.current_nonce
+        request_ranges = self.outbound_tracker.acquire_ranges((node_id, MSG_NONCE_REQUEST, variable_name), missing_nonce_ranges)
+        if len(request_ranges) > 0:
+            msg = Msg().init_nonce_request(variable_name, request_ranges)
+            self.send_threaded(msg, node_id)
+        return True
 
-            msg = Msg().init_sync_mismatch_data(variable_max_nonce_dict)
-            self.send_threaded(msg, ip)
-
-        if msg_type == MSG_SYNC_MISMATCH_DATA:
-            variable_max_nonce_dict = msg.__getitem__("variable_max_nonce_dict")
-            for variable_name in variable_max_nonce_dict:
-                if variable_name not in self.variable_name_to_object:
-                    self.variable_name_to_object[variable_name] = CRDT(variable_name)
-
-                max_nonce = variable_max_nonce_dict[variable_name]
-                missing_nonce_list: List[int] = []
-                for nonce_number in range(max_nonce):
-                    if nonce_number not in self.variable_name_to_object[variable_name].sync_history:
-                        missing_nonce_list.append(nonce_number)
-
-                self.peers_variables_max_nonces[ip] = variable_max_nonce_dict
-
-                msg = Msg().init_nonce_request(variable_name, missing_nonce_list)
-                self.send_threaded(msg, ip)
-
-        if msg_type == MSG_NONCE_REQUEST:
-            try:
-                variable_name = msg.__getitem__("variable_name")
-                nonce_number_list = msg.__getitem__("nonce_number_list")
-                crdt = self.variable_name_to_object[variable_name]
-                nonce_dict = crdt._get_nonce_values(nonce_number_list)
-
-                msg = Msg().init_nonce_send(variable_name, nonce_dict)
-                self.send_threaded(msg, ip)
-            except Exception as e:
-                print(end="")
-
-        if msg_type == MSG_NONCE_SEND:
-            try:
-                variable_name = msg.__getitem__("variable_name")
-                nonce_dict = msg.convert_dict_to_dict(msg.__getitem__("nonce_dict"))
-                self.variable_name_to_object[variable_name].sync_history[ip].update(nonce_dict)
-
-                self.variable_name_to_object[variable_name]._sync_with_history()
-
-            except Exception as e:
-                print(end="")
-
-        if msg_type == MSG_STATUS:
-            try:
-                self.peers[ip] = msg["status"]
-            except Exception as e:
-                print(end="")
-
-        if msg_type == MSG_STATUS_REQUEST:
-            try:
-                self.send_threaded(Msg().init_status(self.current_status), ip)
-            except Exception as e:
-                print(end="")
-
-    def check_everything_is_ready(self) -> None:
-        while True:
-            try:
-                for node_id in self.peers:
-                    self.send_threaded(Msg().init_status(self.current_status), node_id)
-
-                time.sleep(0.1)
-                if self.current_status == "work":
-                    continue
-
-                elif self.current_status == "ready":
-                    while True:
-                        all_in_ready_mode = True
-                        for i in self.peers:
-                            if self.peers[i] == "sync":
-                                all_in_ready_mode = False
-                        if all_in_ready_mode:
-                            break
-
-                    variable_value_dict: dict[str, int] = {}
-                    for variable_name in self.variable_name_to_object:
-                        variable_value_dict[variable_name] = self.variable_name_to_object[variable_name].value
-
-                    msg = Msg().init_stop_sync(variable_value_dict)
-                    for node_id in self.peers:
-                        self.send_threaded(msg, node_id)
-
-                    while True:
-                        time.sleep(0.1)
-                        all_variables_synced = True
-                        for variable_name in self.variable_name_to_object:
-                            all_nodes_have_same_value = True
-                            crdt = self.variable_name_to_object[variable_name]
-                            for node_id in self.peers_sync_values:
-                                if variable_name not in self.peers_sync_values[node_id]:
-                                    all_nodes_have_same_value = False
-                                    all_variables_synced = False
-
-                                elif self.peers_sync_values[node_id][variable_name] != crdt.value:
-                                    all_nodes_have_same_value = False
-                                    all_variables_synced = False
-
-                            if all_nodes_have_same_value:
-                                crdt.reset()
-
-                        if all_variables_synced:
-                            self.current_status = "work"
-                            for node_id in self.peers:
-                                self.send_threaded(Msg().init_status(self.current_status), node_id)
-                            break
-
-                elif self.current_status == "sync":
-                    everything_is_ready = True
-                    if len(self.peers_variables_max_nonces) != len(self.peers) and self.current_status == "sync":
-                        everything_is_ready = False
-                        variable_max_nonce_dict: Dict[str, int] = {}
-                        for variable_name in self.variable_name_to_object:
-                            crdt = self.variable_name_to_object[variable_name]
-                            variable_max_nonce_dict[variable_name] = crdt.current_nonce
-
-                        sync_mismatch_msg = Msg().init_sync_mismatch_request()
-                        for node_ip in self.peers:
-                            self.send_threaded(sync_mismatch_msg, node_ip)
-
-                    for node_id in self.peers_variables_max_nonces:
-                        variable_nonce_dict = self.peers_variables_max_nonces[node_id]
-                        for variable_name in variable_nonce_dict:
-                            max_nonce = variable_nonce_dict[variable_name]
-                            missing_nonce_list: List[int] = []
-
-                            for nonce_number in range(max_nonce):
-                                if variable_name not in self.variable_name_to_object:
-                                    self.variable_name_to_object[variable_name] = CRDT(variable_name)
-
-                                if node_id not in self.variable_name_to_object[variable_name].sync_history:
-                                    msg = Msg().init_nonce_request(variable_name, [0])
-                                    self.send_threaded(msg, node_id)
-
-                                if nonce_number not in self.variable_name_to_object[variable_name].sync_history[node_id]:
-                                    missing_nonce_list.append(nonce_number)
-                                    everything_is_ready = False
-
-                            if len(missing_nonce_list) > 0:
-                                msg = Msg().init_nonce_request(variable_name, missing_nonce_list)
-                                self.send_threaded(msg, node_id)
-
-                    if everything_is_ready:
-                        self.current_status = "ready"
-                        for node_ip in self.peers:
-                            self.send_threaded(Msg().init_status(self.current_status), node_ip)
-                            self.peers_variables_max_nonces = {}
-            except Exception as e:
-                print("check_everything exception:", e)
-
-    def _crdt_handler(self, msg: Msg, ip: str):
-        msg_type = msg.__getitem__("msg_type")
-        if msg_type == MSG_VARIABLE_UPDATE or msg_type == MSG_SYNC_DATA:
-            variable_name = msg.__getitem__("variable_name")
-
-            if variable_name not in self.variable_name_to_object:
-                self.variable_name_to_object[variable_name] = CRDT(variable_name)
-
-            crdt = self.variable_name_to_object[variable_name]
-            crdt.handle_msg(msg, ip)
+    def _handle_crdt_msg(self, msg: Msg, ip: str):
+        crdt = self.variable_name_to_object.get_or_create(msg.__getitem__("variable_name"))
+        crdt.handle_msg(msg, ip)
 
     def _start_full_sync(self):
         self.current_status = "sync"
-        time.sleep(0.1)  # sleep, since we don't use locks. nonce value could be changed by another thread
-
-        variable_max_nonce_dict: Dict[str, int] = {}
-        for variable_name in self.variable_name_to_object:
-            crdt = self.variable_name_to_object[variable_name]
-            variable_max_nonce_dict[variable_name] = crdt.current_nonce
-
-        start_sync_msg = Msg().init_start_sync(variable_max_nonce_dict)
+        self.peers_variables_max_nonces = {}
+        start_sync_msg = Msg().init_start_sync(self._variable_max_nonces())
+        self.flush_updates()
         for node_ip in self.peers:
             self.send_threaded(start_sync_msg, node_ip)
+        self.sync_coordinator.notify()
+
+    def _operate(self, crdt: CRDT, variable_name: str, operation_value: int) -> Optional[int]:
+        with crdt.lock:
+            if self.current_status != STATUS_WORK:
+                return None
+            nonce = crdt.operate(operation_value)
+            self.publish_update(variable_name, operation_value, nonce)
+            return nonce
 
     def handle_user_input(self, operation_value: Union[str, int], variable_name: str):
         variable_name_to_object = self.variable_name_to_object
 
         if operation_value == "create":
-            variable_name_to_object[variable_name] = CRDT(variable_name)
+            crdt = variable_name_to_object.create(variable_name)
+            if self.wal is not None:
+                with crdt.lock:
+                    crdt.last_lsn = self.wal.append(WAL_RECORD_CREATE, variable_name, [])
             return print(f"Created {variable_name} variable")
 
         try:
@@ -444,8 +714,27 @@ class NetworkManager:
                 print(f"{variable_name} - history: : {crdt.get_sync_history()}\n")
             elif operation_value == "sync":
                 self.schedule_full_sync()
+            elif operation_value == "checkpoint":
+                Thread(target=self.checkpointer.run_checkpoint).start()
             elif operation_value == "peers":
                 print(f"peers: {self.peers}")
+                print(f"suspicion (phi): {self.failure_detector.get_phis()}")
+            elif operation_value == "connections":
+                for peer_ip, health in self.transport.get_health().items():
+                    print(f"{peer_ip}: {health}")
+                print(f"dead letters: {self.transport.dead_letters.get_counts()}")
+            elif operation_value == "stats":
+                if not self.metrics.enabled:
+                    print("metrics are disabled")
+                for line in self.metrics.summary():
+                    print(line)
+            elif operation_value == "wal":
+                print(f"write-ahead log: {self.wal.get_stats() if self.wal is not None else 'disabled'}")
+            elif operation_value == "gossip":
+                print(f"gossip: {self.gossiper.get_stats() if self.gossiper.enabled else 'disabled'}")
+            elif operation_value == "queue":
+                print(f"inbound queue: {self.inbound_queue.get_stats()}")
+                print(f"outbound requests: {self.outbound_tracker.get_stats()}")
             elif operation_value == "variables":
                 s = ""
                 for i in self.variable_name_to_object:
@@ -459,93 +748,24 @@ class NetworkManager:
                 print("missing nonce list:", missing_nonce_list)
 
             elif operation_value == "populate":
-                if self.current_status == "work":
-                    for _ in range(0, 10):
-                        number = random.randint(-10000, 10000)
-                        crdt.operate(number)
-                        self.broadcast_threaded(Msg().init_variable_update(variable_name, number, crdt.current_nonce - 1))
-                else:
-                    print("wait full-sync to finish")
+                for _ in range(0, 10):
+                    number = random.randint(-10000, 10000)
+                    if self._operate(crdt, variable_name, number) is None:
+                        print("wait full-sync to finish")
+                        break
             else:
-                if self.current_status == "work":
-                    try:
-                        operation_value = int(operation_value)
-                        crdt.operate(operation_value)
-                        self.broadcast_threaded(Msg().init_variable_update(variable_name, operation_value, crdt.current_nonce - 1))
-                    except Exception as e:
-                        print(f"Encountered error: {e}")
-                else:
-                    print("wait full-sync to finish")
+                try:
+                    operation_value = int(operation_value)
+                    if self._operate(crdt, variable_name, operation_value) is None:
+                        print("wait full-sync to finish")
+                except Exception as e:
+                    print(f"Encountered error: {e}")
         except Exception as e:
             print(f"invalid variable name: {variable_name}")
 
-    def _check_status(self) -> None:
-        while True:
-            if self.current_status == "ready":
-                for i in self.peers:
-                    if self.peers[i] == "ready":
-                        variable_value_dict: dict[str, int] = {}
-                        for variable_name in self.variable_name_to_object:
-                            variable_value_dict[variable_name] = self.variable_name_to_object[variable_name].value
-
-                        msg = Msg().init_stop_sync(variable_value_dict)
-                        for node_id in self.peers:
-                            self.send_threaded(msg, node_id)
-
-                        while True:
-                            all_variables_synced = True
-                            for variable_name in self.variable_name_to_object:
-                                all_nodes_have_same_value = True
-                                crdt = self.variable_name_to_object[variable_name]
-                                for node_id in self.peers_sync_values:
-                                    if self.peers_sync_values[node_id][variable_name] != crdt.value:
-                                        all_nodes_have_same_value = False
-                                        all_variables_synced = False
-
-                                if all_nodes_have_same_value:
-                                    crdt.reset()
-
-                            if all_variables_synced:
-                                break
-                Timer(60.0, self._start_full_sync).start()
-            time.sleep(1)
-
     def schedule_full_sync(self) -> None:
         self._start_full_sync()
 
-    def handle_full_sync(self):
-        while True:
-            if self.current_status == "ready":
-                break
-
-        while True:
-            all_in_ready_mode = True
-            for i in self.peers:
-                if self.peers[i] != "ready":
-                    all_in_ready_mode = False
-            if all_in_ready_mode:
-                break
-
-        variable_value_dict: dict[str, int] = {}
-        for variable_name in self.variable_name_to_object:
-            variable_value_dict[variable_name] = self.variable_name_to_object[variable_name].value
-
-        msg = Msg().init_stop_sync(variable_value_dict)
-        for node_id in self.peers:
-            self.send_threaded(msg, node_id)
-
-        while True:
-            all_variables_synced = True
-            for variable_name in self.variable_name_to_object:
-                all_nodes_have_same_value = True
-                crdt = self.variable_name_to_object[variable_name]
-                for node_id in self.peers_sync_values:
-                    if self.peers_sync_values[node_id][variable_name] != crdt.value:
-                        all_nodes_have_same_value = False
-                        all_variables_synced = False
-
-                if all_nodes_have_same_value:
-                    crdt.reset()
-
-            if all_variables_synced:
-                break
+    def handle_full_sync(self, timeout: float = None) -> bool:
+        self._start_full_sync()
+        return self.sync_coordinator.wait_for_status(STATUS_WORK, timeout)
@@ -0,0 +1,149 @@
+from array import array
+from typing import Dict, Iterator, Optional, Tuple
+
+INT64_MIN = -(1 << 63)
+INT64_MAX = (1 << 63) - 1
+
+
+class OpLog:
+    def __init__(self, items=None):
+        self.clear()
+        if items is not None:
+            self.update(items)
+
+    def clear(self) -> None:
+        self.base = 0
+        self.slots = array("q")
+        self.present = bytearray()
+        # operations outside the int64 range of the slots, the rare value that doesn't fit costs a dict entry
+        self.overflow: Dict[int, int] = {}
+        self.count = 0
+
+    def _has_slot(self, index: int) -> bool:
+        return 0 <= index < len(self.slots) and self.present[index >> 3] & (1 << (index & 7)) != 0
+
+    def _grow_front(self, nonce: int) -> None:
+        # keep the base byte aligned so the presence bitmap can be shifted bytewise
+        shift = self.base - nonce
+        shift += (-shift) % 8
+        self.slots[0:0] = array("q", bytes(8 * shift))
+        self.present[0:0] = bytes(shift // 8)
+        self.base -= shift
+
+    def _grow_back(self, index: int) -> None:
+        missing = index + 1 - len(self.slots)
+        if missing == 1:
+            self.slots.append(0)
+        else:
+            self.slots.extend(array("q", bytes(8 * missing)))
+        missing_bytes = (index >> 3) + 1 - len(self.present)
+        if missing_bytes > 0:
+            self.present.extend(bytes(missing_bytes))
+
+    def __getitem__(self, nonce: int) -> int:
+        index = nonce - self.base
+        if not self._has_slot(index):
+            raise KeyError(nonce)
+        if self.overflow and nonce in self.overflow:
+            return self.overflow[nonce]
+        return self.slots[index]
+
+    def __setitem__(self, nonce: int, value: int) -> None:
+        fits = INT64_MIN <= value <= INT64_MAX
+        if self.count == 0:
+            self.clear()
+            self.base = nonce - nonce % 8
+        elif nonce < self.base:
+            self._grow_front(nonce)
+        index = nonce - self.base
+        if index >= len(self.slots):
+            self._grow_back(index)
+        if fits:
+            self.slots[index] = value
+            if self.overflow:
+                self.overflow.pop(nonce, None)
+        else:
+            self.slots[index] = 0
+            self.overflow[nonce] = value
+        mask = 1 << (index & 7)
+        if not self.present[index >> 3] & mask:
+            self.present[index >> 3] |= mask
+            self.count += 1
+
+    def __delitem__(self, nonce: int) -> None:
+        index = nonce - self.base
+        if not self._has_slot(index):
+            raise KeyError(nonce)
+        self.present[index >> 3] &= ~(1 << (index & 7)) & 0xFF
+        self.slots[index] = 0
+        if self.overflow:
+            self.overflow.pop(nonce, None)
+        self.count -= 1
+
+    def __contains__(self, nonce) -> bool:
+        return isinstance(nonce, int) and self._has_slot(nonce - self.base)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __iter__(self) -> Iterator[int]:
+        return self.keys()
+
+    def __repr__(self) -> str:
+        return repr(dict(self.items()))
+
+    def __eq__(self, other) -> bool:
+        return dict(self.items()) == dict(other.items())
+
+    def get(self, nonce: int, default: Optional[int] = None) -> Optional[int]:
+        index = nonce - self.base
+        if not self._has_slot(index):
+            return default
+        if self.overflow and nonce in self.overflow:
+            return self.overflow[nonce]
+        return self.slots[index]
+
+    def keys(self) -> Iterator[int]:
+        present = self.present
+        for index in range(len(self.slots)):
+            if present[index >> 3] & (1 << (index & 7)):
+                yield self.base + index
+
+    def values(self) -> Iterator[int]:
+        for nonce, value in self.items():
+            yield value
+
+    def items(self) -> Iterator[Tuple[int, int]]:
+        present = self.present
+        slots = self.slots
+        overflow = self.overflow
+        for index in range(len(slots)):
+            if present[index >> 3] & (1 << (index & 7)):
+                nonce = self.base + index
+                yield nonce, overflow[nonce] if overflow and nonce in overflow else slots[index]
+
+    def update(self, other) -> None:
+        items = other.items() if hasattr(other, "items") else other
+        for nonce, value in items:
+            self[nonce] = value
+
+    def compact(self) -> None:
+        # release the leading bytes of the bitmap (and their slots) that no longer hold any operation
+        empty_bytes = 0
+        while empty_bytes < len(self.present) and self.present[empty_bytes] == 0:
+            empty_bytes += 1
+        if empty_bytes == len(self.present):
+            self.clear()
+        elif empty_bytes > 0:
+            del self.present[:empty_bytes]
+            del self.slots[: empty_bytes * 8]
+            self.base += empty_bytes * 8
+
+    def max_nonce(self) -> int:
+        for index in range(len(self.slots) - 1, -1, -1):
+            if self.present[index >> 3] & (1 << (index & 7)):
+                return self.base + index
+        raise ValueError("max_nonce() of empty OpLog")
+
+    def memory_size(self) -> int:
+        return self.slots.itemsize * len(self.slots) + len(self.present) + 2 * self.slots.itemsize * len(self.overflow)
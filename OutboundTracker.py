@@ -0,0 +1,95 @@
+from constants import (
+    SYNC_RETRY_INTERVAL,
+    OUTBOUND_RETRY_MAX,
+)
+
+from threading import Lock
+from RetryPolicy import RetryPolicy
+from typing import Dict, Hashable, List, Tuple
+import time
+
+# (start, end, retry deadline, attempts)
+RangeEntry = Tuple[int, int, float, int]
+
+
+class OutboundTracker:
+    def __init__(self, retry_interval: float = SYNC_RETRY_INTERVAL, max_retry_interval: float = OUTBOUND_RETRY_MAX):
+        self.retry_interval = retry_interval
+        self.max_retry_interval = max_retry_interval
+        self.retry_policy = RetryPolicy(base_delay=retry_interval, max_delay=max_retry_interval)
+        self.lock = Lock()
+        self.in_flight: Dict[Hashable, Tuple[float, int]] = {}
+        self.in_flight_ranges: Dict[Hashable, List[RangeEntry]] = {}
+        self.sent = 0
+        self.suppressed = 0
+        self.retried = 0
+
+    def _next_deadline(self, now: float, attempts: int, retry_interval: float, backoff: bool) -> float:
+        if backoff:
+            retry_interval = self.retry_policy.backoff(attempts - 1, retry_interval)
+        return now + retry_interval
+
+    def try_acquire(self, key: Hashable, retry_interval: float = None, backoff: bool = True) -> bool:
+        # True means the caller should send now; identical messages are held back until their retry deadline
+        retry_interval = retry_interval or self.retry_interval
+        now = time.time()
+        with self.lock:
+            deadline, attempts = self.in_flight.get(key, (0.0, 0))
+            if now < deadline:
+                self.suppressed += 1
+                return False
+            attempts += 1
+            self.retried += attempts > 1
+            self.in_flight[key] = (self._next_deadline(now, attempts, retry_interval, backoff), attempts)
+            self.sent += 1
+            return True
+
+    def acquire_ranges(self, key: Hashable, ranges: List[List[int]]) -> List[List[int]]:
+        # returns the ranges not covered by a request that is still outstanding
+        now = time.time()
+        acquired: List[List[int]] = []
+        with self.lock:
+            entries = [entry for entry in self.in_flight_ranges.get(key, []) if entry[2] > now - self.max_retry_interval]
+            for start, end in ranges:
+                attempts = 0
+                is_covered = False
+                for entry_start, entry_end, deadline, entry_attempts in entries:
+                    if entry_start <= start and end <= entry_end:
+                        attempts = max(attempts, entry_attempts)
+                        is_covered = is_covered or now < deadline
+                if is_covered:
+                    self.suppressed += 1
+                    continue
+                attempts += 1
+                self.retried += attempts > 1
+                entries.append((start, end, self._next_deadline(now, attempts, self.retry_interval, True), attempts))
+                acquired.append([start, end])
+                self.sent += 1
+            self.in_flight_ranges[key] = entries
+        return acquired
+
+    def complete(self, key: Hashable) -> None:
+        with self.lock:
+            self.in_flight.pop(key, None)
+            self.in_flight_ranges.pop(key, None)
+
+    def complete_prefix(self, prefix: Tuple) -> None:
+        with self.lock:
+            for key in [key for key in self.in_flight if key[: len(prefix)] == prefix]:
+                del self.in_flight[key]
+            for key in [key for key in self.in_flight_ranges if key[: len(prefix)] == prefix]:
+                del self.in_flight_ranges[key]
+
+    def clear(self) -> None:
+        with self.lock:
+            self.in_flight = {}
+            self.in_flight_ranges = {}
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {
+                "in_flight": len(self.in_flight) + sum(len(entries) for entries in self.in_flight_ranges.values()),
+                "sent": self.sent,
+                "suppressed": self.suppressed,
+                "retried": self.retried,
+            }
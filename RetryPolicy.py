@@ -0,0 +1,99 @@
+from constants import (
+    SEND_MAX_ATTEMPTS,
+    RECONNECT_BACKOFF_BASE,
+    RECONNECT_BACKOFF_MAX,
+    RETRY_JITTER,
+    CIRCUIT_FAILURE_THRESHOLD,
+    CIRCUIT_RESET_TIMEOUT,
+    DEAD_LETTER_SIZE,
+)
+
+import random
+import time
+from collections import deque
+from threading import Lock
+from typing import Deque, Dict, List, Tuple
+
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half-open"
+
+# (peer, payload size, reason, time)
+DeadLetter = Tuple[str, int, str, float]
+
+
+class RetryPolicy:
+    def __init__(
+        self,
+        max_attempts: int = SEND_MAX_ATTEMPTS,
+        base_delay: float = RECONNECT_BACKOFF_BASE,
+        max_delay: float = RECONNECT_BACKOFF_MAX,
+        jitter: float = RETRY_JITTER,
+    ):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+
+    def backoff(self, attempt: int, base_delay: float = None) -> float:
+        # attempt counts from 0; the jitter only shortens the delay, so retries of many peers drift apart
+        delay = min(self.max_delay, (base_delay or self.base_delay) * (2**attempt))
+        return delay * (1.0 - self.jitter * random.random())
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD, reset_timeout: float = CIRCUIT_RESET_TIMEOUT):
+        # opens after failure_threshold failures in a row; once reset_timeout passes, a single trial send decides
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.lock = Lock()
+        self.state = CIRCUIT_CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+
+    def allow(self) -> bool:
+        with self.lock:
+            if self.state == CIRCUIT_OPEN and time.time() - self.opened_at >= self.reset_timeout:
+                self.state = CIRCUIT_HALF_OPEN
+                return True
+            return self.state == CIRCUIT_CLOSED
+
+    def record_success(self) -> None:
+        with self.lock:
+            self.state = CIRCUIT_CLOSED
+            self.consecutive_failures = 0
+
+    def record_failure(self) -> None:
+        with self.lock:
+            self.consecutive_failures += 1
+            if self.state == CIRCUIT_HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != CIRCUIT_OPEN:
+                    self.times_opened += 1
+                self.state = CIRCUIT_OPEN
+                self.opened_at = time.time()
+
+    def is_open(self) -> bool:
+        # unlike allow() this never starts the trial, so callers can use it to reject early
+        return self.state == CIRCUIT_OPEN and time.time() - self.opened_at < self.reset_timeout
+
+
+class DeadLetters:
+    def __init__(self, max_size: int = DEAD_LETTER_SIZE):
+        # payloads are not kept, a message that gave up is repaired by anti-entropy or the next full-sync
+        self.lock = Lock()
+        self.recent: Deque[DeadLetter] = deque(maxlen=max_size)
+        self.counts: Dict[str, int] = {}
+
+    def add(self, peer: str, payload_size: int, reason: str) -> None:
+        with self.lock:
+            self.recent.append((peer, payload_size, reason, time.time()))
+            self.counts[peer] = self.counts.get(peer, 0) + 1
+
+    def get_counts(self) -> Dict[str, int]:
+        with self.lock:
+            return dict(self.counts)
+
+    def get_recent(self) -> List[DeadLetter]:
+        with self.lock:
+            return list(self.recent)
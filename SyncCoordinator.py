@@ -0,0 +1,175 @@
+from constants import (
+    STATUS_WORK,
+    STATUS_READY,
+    STATUS_SYNC,
+    STATUS_HEARTBEAT_INTERVAL,
+    SYNC_RETRY_INTERVAL,
+    MSG_STATUS,
+    MSG_STOP_SYNC,
+    MSG_SYNC_MISMATCH_REQUEST,
+)
+
+from threading import Condition
+from typing import Callable, Dict
+import time
+from Msg import Msg
+
+
+class SyncCoordinator:
+    def __init__(self, network_manager):
+        self.network_manager = network_manager
+        self.condition = Condition()
+        self.phase_durations: Dict[str, float] = {}
+
+    def notify(self) -> None:
+        with self.condition:
+            self.condition.notify_all()
+
+    def wait_for(self, predicate: Callable[[], bool], timeout: float) -> bool:
+        with self.condition:
+            return self.condition.wait_for(predicate, timeout)
+
+    def _wait_in_phase(self, status: str, predicate: Callable[[], bool], timeout: float) -> bool:
+        network_manager = self.network_manager
+        self.wait_for(lambda: network_manager.current_status != status or predicate(), timeout)
+        return network_manager.current_status == status and predicate()
+
+    def wait_for_status(self, status: str, timeout: float = None) -> bool:
+        return self.wait_for(lambda: self.network_manager.current_status == status, timeout)
+
+    def run(self) -> None:
+        while True:
+            try:
+                status = self.network_manager.current_status
+                started = time.time()
+                self._forget_sent_status()
+                if status == STATUS_WORK:
+                    self._run_work_phase()
+                elif status == STATUS_SYNC:
+                    self._run_sync_phase()
+                elif status == STATUS_READY:
+                    self._run_ready_phase()
+                self.phase_durations[status] = time.time() - started
+                self.network_manager.metrics.observe("sync_phase_seconds", self.phase_durations[status], status)
+            except Exception as e:
+                print("sync coordinator exception:", e)
+                time.sleep(SYNC_RETRY_INTERVAL)
+
+    def _set_status(self, status: str) -> None:
+        self.network_manager.current_status = status
+        self._forget_sent_status()
+        self._send_status()
+        self.notify()
+
+    def _forget_sent_status(self) -> None:
+        for node_id in list(self.network_manager.peers):
+            self.network_manager.outbound_tracker.complete_prefix((node_id, MSG_STATUS))
+
+    def _send_status(self) -> None:
+        # an unchanged status is only repeated once per heartbeat
+        network_manager = self.network_manager
+        status = network_manager.current_status
+        if network_manager.gossiper.enabled:
+            # statuses spread with the gossiped membership table instead of one message per peer
+            network_manager.gossiper.announce(status)
+            return
+        for node_id in list(network_manager.peers):
+            if network_manager.outbound_tracker.try_acquire((node_id, MSG_STATUS, status), STATUS_HEARTBEAT_INTERVAL, False):
+                network_manager.send_threaded(Msg().init_status(status), node_id)
+
+    def _run_work_phase(self) -> None:
+        network_manager = self.network_manager
+        network_manager._release_deferred_msgs()
+        while network_manager.current_status == STATUS_WORK:
+            self._send_status()
+            self.wait_for(lambda: network_manager.current_status != STATUS_WORK, STATUS_HEARTBEAT_INTERVAL)
+
+    def _run_sync_phase(self) -> None:
+        network_manager = self.network_manager
+        network_manager._release_deferred_msgs()
+        network_manager.peers_sync_values = {}
+        while network_manager.current_status == STATUS_SYNC:
+            self._send_status()
+            is_missing_data = self._find_missing_data(send_requests=True)
+
+            # incoming data only triggers a re-check, requests are repeated once per retry interval
+            deadline = time.time() + SYNC_RETRY_INTERVAL
+            while is_missing_data and network_manager.current_status == STATUS_SYNC and time.time() < deadline:
+                with self.condition:
+                    self.condition.wait(max(0.0, deadline - time.time()))
+                is_missing_data = self._find_missing_data(send_requests=False)
+
+            if not is_missing_data and network_manager.current_status == STATUS_SYNC:
+                network_manager.peers_variables_max_nonces = {}
+                self._set_status(STATUS_READY)
+
+    def _find_missing_data(self, send_requests: bool) -> bool:
+        network_manager = self.network_manager
+        is_missing_data = False
+        if len(network_manager.peers_variables_max_nonces) != len(network_manager.peers):
+            is_missing_data = True
+            if send_requests:
+                sync_mismatch_msg = Msg().init_sync_mismatch_request()
+                for node_ip in list(network_manager.peers):
+                    if node_ip in network_manager.peers_variables_max_nonces:
+                        continue
+                    if network_manager.outbound_tracker.try_acquire((node_ip, MSG_SYNC_MISMATCH_REQUEST)):
+                        network_manager.send_threaded(sync_mismatch_msg, node_ip)
+
+        for node_id, variable_nonce_dict in list(network_manager.peers_variables_max_nonces.items()):
+            for variable_name in variable_nonce_dict:
+                network_manager.variable_name_to_object.get_or_create(variable_name)
+                max_nonce = variable_nonce_dict[variable_name]
+                if send_requests:
+                    is_missing = network_manager._request_missing_nonces(variable_name, node_id, max_nonce)
+                else:
+                    crdt = network_manager.variable_name_to_object[variable_name]
+                    is_missing = len(crdt.get_missing_nonce_ranges(node_id, max_nonce)) > 0
+                is_missing_data = is_missing_data or is_missing
+        return is_missing_data
+
+    def _no_peer_in_sync(self) -> bool:
+        peers = self.network_manager.peers
+        return all(peers[node_id] != STATUS_SYNC for node_id in list(peers))
+
+    def _all_peers_agree(self) -> bool:
+        network_manager = self.network_manager
+        for node_id in list(network_manager.peers):
+            if node_id not in network_manager.peers_sync_values:
+                return False
+
+        for variable_name in list(network_manager.variable_name_to_object):
+            crdt = network_manager.variable_name_to_object[variable_name]
+            for node_id in list(network_manager.peers_sync_values):
+                node_values = network_manager.peers_sync_values[node_id]
+                if node_values.get(variable_name) != crdt.value:
+                    return False
+        return True
+
+    def _send_stop_sync(self) -> None:
+        network_manager = self.network_manager
+        variable_value_dict: Dict[str, int] = {}
+        for variable_name in list(network_manager.variable_name_to_object):
+            variable_value_dict[variable_name] = network_manager.variable_name_to_object[variable_name].value
+
+        msg = Msg().init_stop_sync(variable_value_dict)
+        values_key = tuple(sorted(variable_value_dict.items()))
+        for node_id in list(network_manager.peers):
+            if network_manager.outbound_tracker.try_acquire((node_id, MSG_STOP_SYNC, values_key)):
+                network_manager.send_threaded(msg, node_id)
+
+    def _run_ready_phase(self) -> None:
+        network_manager = self.network_manager
+        while not self._wait_in_phase(STATUS_READY, self._no_peer_in_sync, SYNC_RETRY_INTERVAL):
+            if network_manager.current_status != STATUS_READY:
+                return
+            self._send_status()
+
+        self._send_stop_sync()
+        while not self._wait_in_phase(STATUS_READY, self._all_peers_agree, SYNC_RETRY_INTERVAL):
+            if network_manager.current_status != STATUS_READY:
+                return
+            self._send_stop_sync()
+
+        network_manager._finish_sync_round()
+        self._set_status(STATUS_WORK)
@@ -0,0 +1,244 @@
+from constants import (
+    LISTEN_BUFFER_SIZE,
+    DATAGRAM_PAYLOAD_SIZE,
+    MULTICAST_GROUP,
+    MULTICAST_PORT,
+    MULTICAST_TTL,
+)
+
+import socket
+import struct
+import zlib
+from threading import Thread, Lock
+from typing import Callable, Dict, Optional
+from ConnectionPool import ConnectionPool
+from RetryPolicy import RetryPolicy, DeadLetters
+from Framing import recv_frame
+from Fragmenter import Reassembler, fragment
+
+# called with the raw payload and the address of the node that sent it
+ReceiveCallback = Callable[[bytes, str], None]
+
+
+def get_myip() -> str:
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    s.settimeout(0)
+    try:
+        s.connect(("10.254.254.254", 1))
+        ip = s.getsockname()[0]
+    except Exception as e:
+        print("ERROR in get_myip: ", e)
+        ip = "127.0.0.1"
+    finally:
+        s.close()
+    return ip
+
+
+def cluster_group(cluster_name: str) -> str:
+    # every cluster name maps to its own group in the organization-local 239.255.0.0/16 scope
+    group_id = zlib.crc32(cluster_name.encode()) % 0xFFFE + 1
+    return f"239.255.{group_id >> 8}.{group_id & 0xFF}"
+
+
+class Transport:
+    def __init__(self, address: str, retry_policy: RetryPolicy = None):
+        # unicast sends that give up for good end up in dead_letters, whatever the implementation
+        self.address = address
+        self.receive: Optional[ReceiveCallback] = None
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.dead_letters = DeadLetters()
+
+    def start(self, receive: ReceiveCallback) -> None:
+        self.receive = receive
+
+    def send(self, address: str, payload: bytes) -> None:
+        raise NotImplementedError
+
+    def broadcast(self, payload: bytes) -> None:
+        raise NotImplementedError
+
+    def close_peer(self, address: str) -> None:
+        pass
+
+    def can_block(self) -> bool:
+        # whether the receive callback may wait for room in the inbound queue
+        return True
+
+    def get_health(self) -> Dict[str, dict]:
+        return {}
+
+    def get_send_failures(self) -> int:
+        # failed unicast attempts since start, evicted peers included
+        return 0
+
+
+class TcpUdpTransport(Transport):
+    def __init__(self, port: int, address: str = None):
+        # every node listens on the same port: TCP for unicast, UDP broadcast for the whole LAN
+        super().__init__(address or get_myip())
+        self.port = port
+        self.connection_pool = ConnectionPool(port, None, self.retry_policy, self.dead_letters)
+        self.reassembler = Reassembler()
+        # one datagram socket for every broadcast, opened on first use and again after it fails
+        self.send_socket: Optional[socket.socket] = None
+        self.send_lock = Lock()
+
+    def start(self, receive: ReceiveCallback) -> None:
+        super().start(receive)
+        Thread(target=self._listen_tcp).start()
+        Thread(target=self._listen_udp).start()
+
+    def send(self, address: str, payload: bytes) -> None:
+        self.connection_pool.send(address, payload)
+
+    def broadcast(self, payload: bytes) -> None:
+        try:
+            with self.send_lock:
+                if self.send_socket is None:
+                    self.send_socket = self._open_send_socket()
+                for datagram in fragment(payload, DATAGRAM_PAYLOAD_SIZE):
+                    self.send_socket.sendto(datagram, self._broadcast_address())
+        except Exception as e:
+            self._close_send_socket()
+            print(end="")
+
+    def close_peer(self, address: str) -> None:
+        self.connection_pool.remove(address)
+
+    def get_health(self) -> Dict[str, dict]:
+        return self.connection_pool.get_health()
+
+    def get_send_failures(self) -> int:
+        return self.connection_pool.get_total_failures()
+
+    def _open_send_socket(self) -> socket.socket:
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        s.bind(("", 0))
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        return s
+
+    def _close_send_socket(self) -> None:
+        with self.send_lock:
+            if self.send_socket is not None:
+                self.send_socket.close()
+                self.send_socket = None
+
+    def _broadcast_address(self) -> tuple:
+        return ("<broadcast>", self.port)
+
+    def _listen_tcp(self) -> None:
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        s.bind(("", self.port))
+        s.listen(socket.SOMAXCONN)
+        while True:
+            try:
+                conn, addr = s.accept()
+                Thread(target=self._serve_tcp_connection, args=(conn, addr), daemon=True).start()
+            except Exception as e:
+                print(end="")
+
+    def _peer_address(self, conn: socket.socket, addr) -> Optional[str]:
+        return addr[0]
+
+    def _serve_tcp_connection(self, conn: socket.socket, addr) -> None:
+        with conn:
+            try:
+                address = self._peer_address(conn, addr)
+            except (OSError, ConnectionError):
+                return
+            while address is not None:
+                try:
+                    data = recv_frame(conn)
+                    if data is None:
+                        break
+
+                    self.receive(data, address)
+                except OSError:
+                    break
+                except Exception as e:
+                    print(end="")
+
+    def _udp_socket(self) -> socket.socket:
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        s.bind(("", self.port))
+        return s
+
+    def _datagram_address(self, addr) -> str:
+        return addr[0]
+
+    def _listen_udp(self) -> None:
+        # one buffer for every datagram; whatever outlives the receive callback is copied out of it
+        s = self._udp_socket()
+        buffer = bytearray(LISTEN_BUFFER_SIZE)
+        view = memoryview(buffer)
+        while True:
+            try:
+                size, addr = s.recvfrom_into(buffer)
+                self._handle_datagram(view[:size], self._datagram_address(addr))
+            except Exception as e:
+                print(end="")
+
+    def _handle_datagram(self, data: bytes, address: str) -> None:
+        if address == self.address:
+            return
+
+        data = self.reassembler.add(address, data)
+        if data is not None:
+            self.receive(data, address)
+
+
+class MulticastTransport(TcpUdpTransport):
+    def __init__(
+        self,
+        port: int,
+        host: str = None,
+        group: str = MULTICAST_GROUP,
+        group_port: int = MULTICAST_PORT,
+        ttl: int = MULTICAST_TTL,
+    ):
+        # nodes are "host:port", so any number of them can share a host; only members of the group see the traffic
+        host = host or get_myip()
+        super().__init__(port, f"{host}:{port}")
+        self.host = host
+        self.group = group
+        self.group_port = group_port
+        self.ttl = ttl
+        self.connection_pool = ConnectionPool(port, self.address.encode(), self.retry_policy, self.dead_letters)
+
+    def _open_send_socket(self) -> socket.socket:
+        # datagrams leave from the node's own port, so the receiver can tell which node on a host sent them
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        s.bind((self.host, self.port))
+        s.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, self.ttl)
+        s.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+        s.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(self.host))
+        return s
+
+    def _broadcast_address(self) -> tuple:
+        return (self.group, self.group_port)
+
+    def _peer_address(self, conn: socket.socket, addr) -> Optional[str]:
+        # the first frame of every connection names the node behind the ephemeral port
+        greeting = recv_frame(conn)
+        return greeting.decode() if greeting is not None else None
+
+    def _udp_socket(self) -> socket.socket:
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if hasattr(socket, "SO_REUSEPORT"):
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        try:
+            # bound to the group itself, so clusters sharing the port don't see each other's datagrams
+            s.bind((self.group, self.group_port))
+        except OSError:
+            s.bind(("", self.group_port))
+        membership = struct.pack("4s4s", socket.inet_aton(self.group), socket.inet_aton(self.host))
+        s.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+        return s
+
+    def _datagram_address(self, addr) -> str:
+        return f"{addr[0]}:{addr[1]}"
@@ -0,0 +1,59 @@
+from threading import Thread, Lock, Event
+from typing import Callable, Dict, List, Tuple
+import time
+
+Operation = Tuple[int, int]
+FlushCallback = Callable[[str, list], None]
+
+
+class UpdateBatcher:
+    def __init__(self, flush_callback: FlushCallback, window: float, max_operations: int):
+        self.flush_callback = flush_callback
+        self.window = window
+        self.max_operations = max_operations
+        self.pending: Dict[str, List[Operation]] = {}
+        self.lock = Lock()
+        self.has_pending = Event()
+        self.flusher = Thread(target=self._flush_loop, daemon=True)
+        self.flusher.start()
+
+    def add(self, variable_name: str, nonce: int, operation_value: int) -> None:
+        full_batch = None
+        with self.lock:
+            operations = self.pending.setdefault(variable_name, [])
+            operations.append((nonce, operation_value))
+            if len(operations) >= self.max_operations:
+                full_batch = self.pending.pop(variable_name)
+            else:
+                self.has_pending.set()
+
+        if full_batch is not None:
+            self.flush_callback(variable_name, self.to_nonce_ranges(full_batch))
+
+    def flush(self) -> None:
+        with self.lock:
+            pending = self.pending
+            self.pending = {}
+            self.has_pending.clear()
+
+        for variable_name, operations in pending.items():
+            self.flush_callback(variable_name, self.to_nonce_ranges(operations))
+
+    def _flush_loop(self) -> None:
+        while True:
+            self.has_pending.wait()
+            time.sleep(self.window)
+            try:
+                self.flush()
+            except Exception as e:
+                print(end="")
+
+    @staticmethod
+    def to_nonce_ranges(operations: List[Operation]) -> list:
+        nonce_ranges: list = []
+        for nonce, operation_value in sorted(operations):
+            if nonce_ranges and nonce_ranges[-1][0] + len(nonce_ranges[-1][1]) == nonce:
+                nonce_ranges[-1][1].append(operation_value)
+            else:
+                nonce_ranges.append([nonce, [operation_value]])
+        return nonce_ranges
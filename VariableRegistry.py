@@ -0,0 +1,74 @@
+from constants import VARIABLE_SHARD_COUNT
+
+from threading import Lock
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from CRDT import CRDT
+
+
+class VariableRegistry:
+    def __init__(self, crdt_factory: Callable[[str], CRDT], shard_count: int = VARIABLE_SHARD_COUNT):
+        self.crdt_factory = crdt_factory
+        self.shard_locks = [Lock() for _ in range(shard_count)]
+        self.shards: List[Dict[str, CRDT]] = [{} for _ in range(shard_count)]
+
+    def _shard_index(self, variable_name: str) -> int:
+        return hash(variable_name) % len(self.shards)
+
+    def get_or_create(self, variable_name: str) -> CRDT:
+        # lookups and creations of variables in other shards never wait on each other
+        index = self._shard_index(variable_name)
+        crdt = self.shards[index].get(variable_name)
+        if crdt is not None:
+            return crdt
+        with self.shard_locks[index]:
+            crdt = self.shards[index].get(variable_name)
+            if crdt is None:
+                crdt = self.crdt_factory(variable_name)
+                self.shards[index][variable_name] = crdt
+            return crdt
+
+    def create(self, variable_name: str) -> CRDT:
+        index = self._shard_index(variable_name)
+        crdt = self.crdt_factory(variable_name)
+        with self.shard_locks[index]:
+            self.shards[index][variable_name] = crdt
+        return crdt
+
+    def get(self, variable_name: str, default: Optional[CRDT] = None) -> Optional[CRDT]:
+        return self.shards[self._shard_index(variable_name)].get(variable_name, default)
+
+    def __getitem__(self, variable_name: str) -> CRDT:
+        return self.shards[self._shard_index(variable_name)][variable_name]
+
+    def __setitem__(self, variable_name: str, crdt: CRDT) -> None:
+        index = self._shard_index(variable_name)
+        with self.shard_locks[index]:
+            self.shards[index][variable_name] = crdt
+
+    def clear(self) -> None:
+        for lock, shard in zip(self.shard_locks, self.shards):
+            with lock:
+                shard.clear()
+
+    def __contains__(self, variable_name) -> bool:
+        return variable_name in self.shards[self._shard_index(variable_name)]
+
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self.shards)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.keys())
+
+    def keys(self) -> List[str]:
+        variable_names: List[str] = []
+        for lock, shard in zip(self.shard_locks, self.shards):
+            with lock:
+                variable_names.extend(shard)
+        return variable_names
+
+    def items(self) -> List[Tuple[str, CRDT]]:
+        variable_items: List[Tuple[str, CRDT]] = []
+        for lock, shard in zip(self.shard_locks, self.shards):
+            with lock:
+                variable_items.extend(shard.items())
+        return variable_items
@@ -0,0 +1,218 @@
+from constants import (
+    WAL_FSYNC_INTERVAL,
+    WAL_BUFFER_SIZE,
+    WAL_SEGMENT_SIZE,
+    WAL_SNAPSHOT_INTERVAL,
+)
+
+import mmap
+import os
+import struct
+import time
+import zlib
+from threading import Event, Lock, Thread
+from typing import Callable, Iterator, List, Optional, Tuple
+from BinaryCodec import write_value, read_value
+
+# body length and crc32 of the body; a record whose checksum doesn't match is a torn write and ends the log
+RECORD_HEADER = struct.Struct("!II")
+SEGMENT_PREFIX = "wal-"
+SEGMENT_SUFFIX = ".log"
+SNAPSHOT_NAME = "snapshot.bin"
+
+# (lsn, record type, variable name, arguments)
+LogRecord = Tuple[int, int, str, list]
+
+
+def encode_record(value) -> bytes:
+    body = bytearray()
+    write_value(body, value)
+    return RECORD_HEADER.pack(len(body), zlib.crc32(body)) + body
+
+
+def read_records(data, size: int) -> Iterator[Tuple[object, int]]:
+    # yields each intact record and the offset right after it
+    offset = 0
+    while offset + RECORD_HEADER.size <= size:
+        length, checksum = RECORD_HEADER.unpack_from(data, offset)
+        start = offset + RECORD_HEADER.size
+        end = start + length
+        if end > size or zlib.crc32(data[start:end]) != checksum:
+            return
+        value, _ = read_value(data, start)
+        offset = end
+        yield value, offset
+
+
+class WriteAheadLog:
+    def __init__(
+        self,
+        directory: str,
+        fsync_interval: float = WAL_FSYNC_INTERVAL,
+        segment_size: int = WAL_SEGMENT_SIZE,
+        snapshot_interval: float = WAL_SNAPSHOT_INTERVAL,
+    ):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.fsync_interval = fsync_interval
+        self.segment_size = segment_size
+        self.snapshot_interval = snapshot_interval
+        self.lock = Lock()
+        self.sync_lock = Lock()
+        self.snapshot_lock = Lock()
+        self.snapshot_requested = Event()
+        self.buffer = bytearray()
+        self.lsn = 0
+        self.written_lsn = 0
+        self.durable_lsn = 0
+        self.segment_id = 0
+        self.segment_bytes = 0
+        self.fd: Optional[int] = None
+        self.last_snapshot = time.time()
+        self.fsyncs = 0
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _segment_path(self, segment_id: int) -> str:
+        return self._path(f"{SEGMENT_PREFIX}{segment_id:08d}{SEGMENT_SUFFIX}")
+
+    def _segment_ids(self) -> List[int]:
+        segment_ids = []
+        for name in os.listdir(self.directory):
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX):
+                segment_ids.append(int(name[len(SEGMENT_PREFIX) : -len(SEGMENT_SUFFIX)]))
+        return sorted(segment_ids)
+
+    def _read_file(self, path: str) -> Iterator[Tuple[object, int]]:
+        # replay reads straight from the page cache through mmap instead of copying whole segments
+        with open(path, "rb") as file:
+            size = os.fstat(file.fileno()).st_size
+            if size == 0:
+                return
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                yield from read_records(data, size)
+
+    def load_snapshot(self) -> Optional[dict]:
+        path = self._path(SNAPSHOT_NAME)
+        if not os.path.exists(path):
+            return None
+        for state, _ in self._read_file(path):
+            self.lsn = max(self.lsn, state["lsn"])
+            return state
+        return None
+
+    def read_log(self) -> Iterator[LogRecord]:
+        for segment_id in self._segment_ids():
+            path = self._segment_path(segment_id)
+            end = 0
+            for record, end in self._read_file(path):
+                self.lsn = max(self.lsn, record[0])
+                yield record[0], record[1], record[2], record[3]
+            if end < os.path.getsize(path):
+                # a crash cut the last write short; everything after it was never acknowledged
+                os.truncate(path, end)
+
+    def open(self) -> None:
+        # always a fresh segment, so nothing is ever appended after a torn record
+        with self.lock:
+            self._open_segment(max([self.segment_id] + self._segment_ids()) + 1)
+
+    def _open_segment(self, segment_id: int) -> None:
+        self.segment_id = segment_id
+        self.segment_bytes = 0
+        self.fd = os.open(self._segment_path(segment_id), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+
+    def append(self, record_type: int, name: str, args) -> int:
+        with self.lock:
+            self.lsn += 1
+            self.buffer += encode_record([self.lsn, record_type, name, list(args)])
+            if len(self.buffer) >= WAL_BUFFER_SIZE:
+                self._write_buffer()
+            return self.lsn
+
+    def _write_buffer(self) -> None:
+        view = memoryview(self.buffer)
+        while len(view) > 0:
+            view = view[os.write(self.fd, view) :]
+        view.release()
+        self.segment_bytes += len(self.buffer)
+        self.buffer.clear()
+        self.written_lsn = self.lsn
+
+    def sync(self) -> None:
+        # group commit: whoever gets the sync lock fsyncs for every record appended so far
+        target_lsn = self.lsn
+        if self.durable_lsn >= target_lsn or self.fd is None:
+            return
+        with self.sync_lock:
+            if self.durable_lsn >= target_lsn:
+                return
+            with self.lock:
+                self._write_buffer()
+                written_lsn = self.written_lsn
+            os.fsync(self.fd)
+            self.fsyncs += 1
+            self.durable_lsn = max(self.durable_lsn, written_lsn)
+
+    def _rotate(self) -> int:
+        with self.sync_lock:
+            with self.lock:
+                self._write_buffer()
+                os.fsync(self.fd)
+                self.durable_lsn = max(self.durable_lsn, self.written_lsn)
+                os.close(self.fd)
+                self._open_segment(self.segment_id + 1)
+                return self.segment_id
+
+    def snapshot(self, snapshot_source: Callable[[], dict]) -> None:
+        # records of the new segment may already be in the snapshot; replay skips them by lsn
+        with self.snapshot_lock:
+            self.snapshot_requested.clear()
+            segment_id = self._rotate()
+            state = snapshot_source()
+            state["lsn"] = self.lsn
+            temporary_path = self._path(SNAPSHOT_NAME + ".tmp")
+            with open(temporary_path, "wb") as file:
+                file.write(encode_record(state))
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temporary_path, self._path(SNAPSHOT_NAME))
+            directory_fd = os.open(self.directory, os.O_RDONLY)
+            try:
+                os.fsync(directory_fd)
+            finally:
+                os.close(directory_fd)
+            for old_segment_id in self._segment_ids():
+                if old_segment_id < segment_id:
+                    os.remove(self._segment_path(old_segment_id))
+            self.last_snapshot = time.time()
+
+    def request_snapshot(self) -> None:
+        self.snapshot_requested.set()
+
+    def start(self, snapshot_source: Callable[[], dict]) -> None:
+        Thread(target=self._flush_loop, args=(snapshot_source,), daemon=True).start()
+
+    def _flush_loop(self, snapshot_source: Callable[[], dict]) -> None:
+        while True:
+            self.snapshot_requested.wait(self.fsync_interval)
+            try:
+                self.sync()
+                if (
+                    self.snapshot_requested.is_set()
+                    or self.segment_bytes >= self.segment_size
+                    or time.time() - self.last_snapshot >= self.snapshot_interval
+                ):
+                    self.snapshot(snapshot_source)
+            except Exception as e:
+                print("write-ahead log exception:", e)
+
+    def get_stats(self) -> dict:
+        return {
+            "lsn": self.lsn,
+            "durable_lsn": self.durable_lsn,
+            "segment": self.segment_id,
+            "segment_bytes": self.segment_bytes + len(self.buffer),
+            "fsyncs": self.fsyncs,
+        }
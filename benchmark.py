@@ -0,0 +1,240 @@
+from NetworkManager import NetworkManager
+from Msg import Msg
+from InMemoryTransport import InMemoryNetwork, InMemoryTransport
+from constants import (
+    MSG_VARIABLE_UPDATE,
+    MSG_VARIABLE_UPDATE_BATCH,
+    MSG_GOSSIP,
+    STATUS_WORK,
+    BATCH_WINDOW,
+    BATCH_MAX_OPERATIONS,
+    WIRE_FORMAT_BINARY,
+    WIRE_FORMAT_JSON,
+    HISTORY_STORE_DICT,
+    HISTORY_STORE_ARRAY,
+)
+
+from threading import Thread, Lock
+from typing import Dict, List, Optional, Tuple
+import argparse
+import json
+import random
+import time
+
+UpdateKey = Tuple[str, str, int]
+
+
+def msg_type_of(payload: bytes) -> str:
+    # binary payloads carry the type in the header, only JSON has to be decoded
+    msg_type, _ = Msg.peek_header(payload)
+    return msg_type if msg_type is not None else Msg().from_bytes(payload)["msg_type"]
+
+
+class ClusterBenchmark:
+    def __init__(self, node_count: int, variable_count: int, network: InMemoryNetwork, seed: Optional[int] = None, **options):
+        self.network = network
+        # each driver draws its operations from its own generator, so a seed repeats the workload as well as the network
+        self.seed = seed
+        self.nodes = [
+            NetworkManager(0, transport=InMemoryTransport(network, f"node-{index}"), **options) for index in range(node_count)
+        ]
+        self.variable_names = [f"var-{index}" for index in range(variable_count)]
+        self.sent_at: Dict[UpdateKey, float] = {}
+        self.latencies: List[float] = []
+        self.latency_lock = Lock()
+        self.operations = 0
+        for node in self.nodes:
+            self._instrument(node)
+
+    def _instrument(self, node: NetworkManager) -> None:
+        # propagation latency: from the local operate call to the update being applied on a peer
+        node.register_handler(MSG_VARIABLE_UPDATE, self._record_latency)
+        node.register_handler(MSG_VARIABLE_UPDATE_BATCH, self._record_latency)
+        node.register_handler(MSG_GOSSIP, self._record_gossip_latency)
+
+    def _record_latency(self, msg: Msg, ip: str) -> None:
+        if msg["msg_type"] == MSG_VARIABLE_UPDATE:
+            nonces = [msg["nonce"]]
+        else:
+            nonces = [start + offset for start, values in msg["nonce_ranges"] for offset in range(len(values))]
+        self._record(msg["variable_name"], ip, nonces)
+
+    def _record_gossip_latency(self, msg: Msg, ip: str) -> None:
+        # with gossip most nodes get an update passed on by another peer rather than from its origin
+        for variable_name, origins in msg.get("operations", {}).items():
+            for origin, (_, nonce_ranges) in origins.items():
+                self._record(variable_name, origin, [start + offset for start, values in nonce_ranges for offset in range(len(values))])
+
+    def _record(self, variable_name: str, origin: str, nonces: List[int]) -> None:
+        now = time.time()
+        with self.latency_lock:
+            for nonce in nonces:
+                sent_at = self.sent_at.get((variable_name, origin, nonce))
+                if sent_at is not None:
+                    self.latencies.append(now - sent_at)
+
+    def start(self, timeout: float = 10.0) -> float:
+        started = time.time()
+        for node in self.nodes:
+            node.listen_threaded()
+            Thread(target=node.check_everything_is_ready, daemon=True).start()
+            Thread(target=node.periodic_hello_broadcast, daemon=True).start()
+            Thread(target=node.detect_failures, daemon=True).start()
+            Thread(target=node._sync_broadcast, daemon=True).start()
+            if node.gossiper.enabled:
+                Thread(target=node.gossiper.run, daemon=True).start()
+        self._wait(lambda: all(len(node.peers) == len(self.nodes) - 1 for node in self.nodes), timeout)
+        for node in self.nodes:
+            for variable_name in self.variable_names:
+                node.variable_name_to_object.get_or_create(variable_name)
+        return time.time() - started
+
+    def _wait(self, predicate, timeout: float) -> bool:
+        deadline = time.time() + timeout
+        while not predicate():
+            if time.time() > deadline:
+                return False
+            time.sleep(0.005)
+        return True
+
+    def _drive(self, node: NetworkManager, rate: float, duration: float, counts: List[int], index: int) -> None:
+        rng = random.Random(None if self.seed is None else f"{self.seed}-{index}")
+        interval = 1.0 / rate if rate > 0 else 0.0
+        deadline = time.time() + duration
+        next_at = time.time()
+        while time.time() < deadline:
+            variable_name = rng.choice(self.variable_names)
+            crdt = node.variable_name_to_object[variable_name]
+            started = time.time()
+            nonce = node._operate(crdt, variable_name, rng.randint(-10, 10))
+            if nonce is not None:
+                self.sent_at[(variable_name, node.ip, nonce)] = started
+                counts[index] += 1
+            if interval > 0:
+                next_at += interval
+                delay = next_at - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+
+    def _values(self) -> List[Dict[str, int]]:
+        return [{name: node.variable_name_to_object[name].value for name in self.variable_names} for node in self.nodes]
+
+    def _converged(self) -> bool:
+        values = self._values()
+        return all(node_values == values[0] for node_values in values)
+
+    def run(self, rate: float, duration: float, sync_rounds: int, timeout: float = 30.0) -> dict:
+        self.network.reset_counters()
+        counts = [0 for _ in self.nodes]
+        drivers = [Thread(target=self._drive, args=(node, rate, duration, counts, index)) for index, node in enumerate(self.nodes)]
+        started = time.time()
+        for driver in drivers:
+            driver.start()
+        for driver in drivers:
+            driver.join()
+        write_time = time.time() - started
+        for node in self.nodes:
+            node.flush_updates()
+
+        stopped = time.time()
+        converged = self._wait(self._converged, timeout)
+        convergence_time = time.time() - stopped
+        operations = sum(counts)
+        network_stats = self.network.get_stats()
+
+        sync_times = []
+        for sync_round in range(sync_rounds):
+            node = self.nodes[sync_round % len(self.nodes)]
+            expected_round = node.sync_round + 1
+            started = time.time()
+            node._start_full_sync()
+            self._wait(
+                lambda: all(other.sync_round >= expected_round and other.current_status == STATUS_WORK for other in self.nodes),
+                timeout,
+            )
+            sync_times.append(time.time() - started)
+
+        with self.latency_lock:
+            latencies = sorted(self.latencies)
+        total_messages = network_stats["messages"]
+        total_bytes = network_stats["bytes"]
+        return {
+            "nodes": len(self.nodes),
+            "variables": len(self.variable_names),
+            "operations": operations,
+            "ops_per_second": operations / write_time if write_time > 0 else 0.0,
+            "converged": converged and self._converged(),
+            "convergence_time": convergence_time,
+            "full_sync_times": sync_times,
+            "messages": total_messages,
+            "bytes": total_bytes,
+            "messages_per_op": total_messages / operations if operations else 0.0,
+            "bytes_per_op": total_bytes / operations if operations else 0.0,
+            "messages_lost": network_stats["dropped"],
+            "messages_by_type": network_stats["messages_by_type"],
+            "latency_p50": percentile(latencies, 0.50),
+            "latency_p99": percentile(latencies, 0.99),
+            "latency_max": latencies[-1] if latencies else 0.0,
+        }
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[int(fraction * (len(sorted_values) - 1))]
+
+
+def print_report(report: dict) -> None:
+    print(f"nodes: {report['nodes']}  variables: {report['variables']}  operations: {report['operations']}")
+    print(f"throughput: {report['ops_per_second']:.0f} ops/s")
+    print(f"converged: {report['converged']} in {report['convergence_time'] * 1000:.1f} ms after writes stopped")
+    print(f"full-sync: {', '.join(f'{sync_time * 1000:.1f} ms' for sync_time in report['full_sync_times'])}")
+    print(f"messages: {report['messages']} ({report['messages_per_op']:.3f}/op, {report['messages_lost']} lost)  bytes: {report['bytes']} ({report['bytes_per_op']:.1f}/op)")
+    print(f"propagation latency: p50 {report['latency_p50'] * 1000:.2f} ms  p99 {report['latency_p99'] * 1000:.2f} ms  max {report['latency_max'] * 1000:.2f} ms")
+    for msg_type, count in sorted(report["messages_by_type"].items(), key=lambda item: -item[1]):
+        print(f"  {msg_type}: {count}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nodes", type=int, default=3)
+    parser.add_argument("--variables", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=1000, help="operations per second per node, 0 for as fast as possible")
+    parser.add_argument("--duration", type=float, default=3.0)
+    parser.add_argument("--sync-rounds", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.0, help="one-way delivery delay in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random delay of up to this many seconds")
+    parser.add_argument("--loss", type=float, default=0.0, help="fraction of datagrams dropped, unicast sends are never lost")
+    parser.add_argument("--reorder", type=float, default=0.0, help="fraction of datagrams held back behind later ones")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--batch-window", type=float, default=BATCH_WINDOW)
+    parser.add_argument("--batch-max-operations", type=int, default=BATCH_MAX_OPERATIONS)
+    parser.add_argument("--wire-format", choices=[WIRE_FORMAT_BINARY, WIRE_FORMAT_JSON], default=WIRE_FORMAT_BINARY)
+    parser.add_argument("--history-store", choices=[HISTORY_STORE_DICT, HISTORY_STORE_ARRAY], default=HISTORY_STORE_DICT)
+    parser.add_argument("--no-metrics", action="store_true")
+    parser.add_argument("--gossip-fanout", type=int, default=0, help="random peers per gossip round, 0 broadcasts to everyone")
+    parser.add_argument("--json", action="store_true")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    network = InMemoryNetwork(args.latency, args.jitter, args.loss, args.reorder, seed=args.seed, classify=msg_type_of)
+    benchmark = ClusterBenchmark(
+        args.nodes,
+        args.variables,
+        network,
+        seed=args.seed,
+        batch_window=args.batch_window,
+        batch_max_operations=args.batch_max_operations,
+        wire_format=args.wire_format,
+        history_store=args.history_store,
+        metrics_enabled=not args.no_metrics,
+        gossip_fanout=args.gossip_fanout,
+    )
+    benchmark.start()
+    report = benchmark.run(args.rate, args.duration, args.sync_rounds)
+    if args.json:
+        print(json.dumps(report))
+    else:
+        print_report(report)
@@ -3,6 +3,7 @@ from enum import Enum
 MSG_HELLO = "hello"
 MSG_HELLO_RECEIVED = "hello_received"
 MSG_VARIABLE_UPDATE = "variable_update"
+MSG_VARIABLE_UPDATE_BATCH = "variable_update_batch"
 MSG_START_SYNC = "start_sync"
 MSG_STOP_SYNC = "stop_sync"
 MSG_STATUS_REQUEST = "status_request"
@@ -12,9 +13,91 @@ MSG_NONCE_SEND = "nonce_send"
 MSG_SYNC_DATA = "sync_data"
 MSG_SYNC_MISMATCH_DATA = "sync_mismatch_data"
 MSG_SYNC_MISMATCH_REQUEST = "sync_mismatch_request"
+MSG_VERSION_VECTOR = "version_vector"
+MSG_CHECKPOINT_PROPOSE = "checkpoint_propose"
+MSG_CHECKPOINT_VOTE = "checkpoint_vote"
+MSG_CHECKPOINT_COMMIT = "checkpoint_commit"
+MSG_GOSSIP = "gossip"
 
 STATUS_WORK = "work"
 STATUS_READY = "ready"
 STATUS_SYNC = "sync"
 
 LISTEN_BUFFER_SIZE = 8192
+
+STATUS_HEARTBEAT_INTERVAL = 1.0
+SYNC_RETRY_INTERVAL = 0.5
+OUTBOUND_RETRY_MAX = 4.0
+HELLO_INTERVAL_MIN = 0.1
+HELLO_INTERVAL_MAX = 2.0
+FAILURE_CHECK_INTERVAL = 0.5
+PHI_THRESHOLD = 8.0
+PHI_WINDOW_SIZE = 100
+PHI_MIN_STD_DEV = 0.1
+PHI_ACCEPTABLE_PAUSE = 2.0
+CHECKPOINT_VOTE_TIMEOUT = 2.0
+
+CONNECT_TIMEOUT = 2.0
+SEND_QUEUE_SIZE = 10000
+SEND_MAX_ATTEMPTS = 5
+RECONNECT_BACKOFF_BASE = 0.05
+RECONNECT_BACKOFF_MAX = 2.0
+RETRY_JITTER = 0.2
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_RESET_TIMEOUT = 5.0
+DEAD_LETTER_SIZE = 1000
+
+WAL_RECORD_CREATE = 0
+WAL_RECORD_OPERATE = 1
+WAL_RECORD_UPDATE = 2
+WAL_RECORD_SYNC_DATA = 3
+WAL_RECORD_MERGE = 4
+WAL_RECORD_SYNC = 5
+WAL_RECORD_RESET = 6
+WAL_RECORD_CHECKPOINT = 7
+WAL_RECORD_RETIRE = 8
+WAL_RECORD_ROUND = 9
+WAL_RECORD_PEER = 10
+
+BATCH_WINDOW = 0.01
+BATCH_MAX_OPERATIONS = 256
+
+WIRE_FORMAT_JSON = "json"
+WIRE_FORMAT_BINARY = "binary"
+BINARY_MAGIC = 0xB7
+BINARY_VERSION = 4
+
+MAX_FRAME_SIZE = 64 * 1024 * 1024
+DATAGRAM_PAYLOAD_SIZE = 8000
+FRAGMENT_MAGIC = 0xF7
+MAX_REASSEMBLY_BYTES = 32 * 1024 * 1024
+REASSEMBLY_TIMEOUT = 5.0
+SYNC_CHUNK_SIZE = 2000
+MULTICAST_GROUP = "239.255.48.87"
+MULTICAST_PORT = 12300
+MULTICAST_TTL = 1
+INMEMORY_REORDER_DELAY = 0.005
+WAL_FSYNC_INTERVAL = 0.05
+WAL_BUFFER_SIZE = 64 * 1024
+WAL_SEGMENT_SIZE = 64 * 1024 * 1024
+WAL_SNAPSHOT_INTERVAL = 300.0
+METRICS_NAMESPACE = "crdt"
+LATENCY_BUCKETS = [0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+ANTI_ENTROPY_INTERVAL = 10.0
+GOSSIP_FANOUT = 3
+GOSSIP_INTERVAL = 0.2
+GOSSIP_MAX_OPERATIONS = 2000
+
+HISTORY_STORE_DICT = "dict"
+HISTORY_STORE_ARRAY = "array"
+
+VARIABLE_SHARD_COUNT = 16
+
+PRIORITY_CONTROL = 0
+PRIORITY_UPDATE = 1
+PRIORITY_BULK = 2
+DROP_POLICY_BLOCK = "block"
+DROP_POLICY_DROP_NEWEST = "drop-newest"
+DROP_POLICY_DROP_LOWEST = "drop-lowest"
+INBOUND_WORKER_COUNT = 4
+INBOUND_QUEUE_SIZE = 10000
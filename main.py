@@ -1,6 +1,27 @@
 from NetworkManager import NetworkManager, Msg
+from AsyncNetworkManager import AsyncNetworkManager
+from Transport import MulticastTransport, cluster_group
 from CRDT import CRDT
+from constants import (
+    BATCH_WINDOW,
+    BATCH_MAX_OPERATIONS,
+    WIRE_FORMAT_BINARY,
+    WIRE_FORMAT_JSON,
+    HISTORY_STORE_DICT,
+    HISTORY_STORE_ARRAY,
+    INBOUND_WORKER_COUNT,
+    INBOUND_QUEUE_SIZE,
+    DROP_POLICY_BLOCK,
+    DROP_POLICY_DROP_NEWEST,
+    DROP_POLICY_DROP_LOWEST,
+    MULTICAST_GROUP,
+    MULTICAST_PORT,
+    MULTICAST_TTL,
+    GOSSIP_FANOUT,
+    GOSSIP_INTERVAL,
+)
 from threading import Thread
+import argparse
 
 
 def handle_user_input(network_manager: NetworkManager):
@@ -10,26 +31,84 @@ def handle_user_input(network_manager: NetworkManager):
         user_input = input()
         try:
             operation_value, variable_name = user_input.split()
-            thread = Thread(
-                target=network_manager.handle_user_input,
-                args=(
-                    operation_value,
-                    variable_name,
-                ),
-            )
-            thread.start()
+            network_manager.handle_user_input_threaded(operation_value, variable_name)
 
         except Exception as e:
             print(f"Exception occured: {e}")
 
 
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=12345)
+    parser.add_argument("--transport", choices=["threaded", "asyncio", "multicast"], default="threaded")
+    parser.add_argument("--host", default=None, help="interface to bind in multicast mode")
+    parser.add_argument("--cluster", default=None, help="cluster name, picks the multicast group so clusters can share a network")
+    parser.add_argument("--multicast-group", default=None, help=f"explicit multicast group, default {MULTICAST_GROUP}")
+    parser.add_argument("--multicast-port", type=int, default=MULTICAST_PORT)
+    parser.add_argument("--multicast-ttl", type=int, default=MULTICAST_TTL, help="router hops multicast traffic may cross")
+    parser.add_argument("--batch-window", type=float, default=BATCH_WINDOW)
+    parser.add_argument("--batch-max-operations", type=int, default=BATCH_MAX_OPERATIONS)
+    parser.add_argument("--wire-format", choices=[WIRE_FORMAT_BINARY, WIRE_FORMAT_JSON], default=WIRE_FORMAT_BINARY)
+    parser.add_argument("--history-store", choices=[HISTORY_STORE_DICT, HISTORY_STORE_ARRAY], default=HISTORY_STORE_DICT)
+    parser.add_argument("--debug-verify", action="store_true")
+    parser.add_argument("--checkpoint-interval", type=float, default=0)
+    parser.add_argument("--inbound-workers", type=int, default=INBOUND_WORKER_COUNT)
+    parser.add_argument("--inbound-queue-size", type=int, default=INBOUND_QUEUE_SIZE)
+    parser.add_argument("--metrics-port", type=int, default=0, help="serve Prometheus metrics on this local port, 0 disables it")
+    parser.add_argument("--no-metrics", action="store_true")
+    parser.add_argument("--data-dir", default=None, help="keep a write-ahead log and snapshots here and recover from them on start")
+    parser.add_argument(
+        "--gossip-fanout",
+        type=int,
+        default=0,
+        help=f"spread updates and statuses to this many random peers per round instead of everyone, e.g. {GOSSIP_FANOUT}; 0 disables gossip",
+    )
+    parser.add_argument("--gossip-interval", type=float, default=GOSSIP_INTERVAL)
+    parser.add_argument("--seeds", default="", help="comma separated peers to contact directly, for clusters spanning subnets")
+    parser.add_argument(
+        "--inbound-drop-policy",
+        choices=[DROP_POLICY_DROP_LOWEST, DROP_POLICY_DROP_NEWEST, DROP_POLICY_BLOCK],
+        default=DROP_POLICY_DROP_LOWEST,
+    )
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
-    network_manager = NetworkManager(12345)
-    network_manager.listen_tcp_threaded()
-    network_manager.listen_udp_threaded()
+    args = parse_args()
+    options = {
+        "batch_window": args.batch_window,
+        "batch_max_operations": args.batch_max_operations,
+        "wire_format": args.wire_format,
+        "history_store": args.history_store,
+        "debug_verify": args.debug_verify,
+        "inbound_workers": args.inbound_workers,
+        "inbound_queue_size": args.inbound_queue_size,
+        "inbound_drop_policy": args.inbound_drop_policy,
+        "metrics_enabled": not args.no_metrics,
+        "data_dir": args.data_dir,
+        "gossip_fanout": args.gossip_fanout,
+        "gossip_interval": args.gossip_interval,
+        "seeds": [seed for seed in args.seeds.split(",") if seed],
+    }
+    if args.transport == "asyncio":
+        network_manager = AsyncNetworkManager(args.port, **options)
+    elif args.transport == "multicast":
+        group = args.multicast_group or (cluster_group(args.cluster) if args.cluster else MULTICAST_GROUP)
+        transport = MulticastTransport(args.port, args.host, group, args.multicast_port, args.multicast_ttl)
+        network_manager = NetworkManager(args.port, transport=transport, **options)
+    else:
+        network_manager = NetworkManager(args.port, **options)
+    network_manager.listen_threaded()
+    if args.metrics_port > 0:
+        network_manager.metrics.serve(args.metrics_port)
     network_manager.schedule_sync_broadcast()
-    Thread(target=network_manager.periodic_hello_broadcast, args=(0.1,)).start()
+    Thread(target=network_manager.periodic_hello_broadcast).start()
+    Thread(target=network_manager.detect_failures).start()
     Thread(target=network_manager.check_everything_is_ready).start()
+    if args.checkpoint_interval > 0:
+        Thread(target=network_manager.checkpointer.periodic_checkpoint, args=(args.checkpoint_interval,)).start()
+    if network_manager.gossiper.enabled:
+        Thread(target=network_manager.gossiper.run).start()
 
     thread = Thread(target=handle_user_input, args=(network_manager,))
     thread.start()